@@ -0,0 +1,183 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# benchmarks of the ingest path on quiet and harbour traffic, under cpython
+# or the micropython unix port so a change can be timed on both before it
+# goes to the pico:
+#
+#   python3 sim/bench.py [results.json] [seconds of traffic]
+#   micropython sim/bench.py [results.json] [seconds of traffic]
+#
+# Each stage is timed alone on the same sentences: the checksum, ais and gps
+# decoding and alarm.compute.  Then the ingest tasks themselves,
+# ais_monitor.receive_ais and receive_gps, are run over every sentence with
+# readline replaced by the list of sentences, so decoding, alarms, the target
+# table and queueing for tcp and websocket clients are all as on the pico.
+# Client queues are drained between sentences as their senders would.
+# Allocation per message is measured with the collector off, which only
+# micropython can report.
+import sys, time, gc, json, os
+
+micropython = sys.implementation.name == 'micropython'
+if micropython: # no os.path, set the paths host.install would
+    sim_dir = __file__.rsplit('/', 1)[0] if '/' in __file__ else '.'
+    sys.path[:0] = [sim_dir + '/fakes', sim_dir + '/../src', sim_dir]
+else:
+    import host
+    host.install()
+
+import traffic
+import nmea
+from decode_ais import decode_ais
+from decode_gps import decode_gps
+import alarm, targets, sendqueue, backlog, wireless, web, latency
+import ais_monitor
+
+min_calls = 2000 # each benchmark repeats its sentences at least this often
+alloc_calls = 100 # calls measured for allocation with the collector off
+client_counts = (0, 1, 4) # tcp and websocket clients for the ingest tasks
+traced_clients = 4 # ingest again with every sentence traced, for the cost of tracing
+
+# bytes allocated per message, None where it cannot be measured
+def allocated(function, items, size):
+    if micropython:
+        items = items[:max(alloc_calls // size, 1)]
+        gc.collect()
+        gc.disable()
+        a0 = gc.mem_alloc()
+        for item in items:
+            function(item)
+        a1 = gc.mem_alloc()
+        gc.enable()
+        return (a1 - a0) / (len(items) * size)
+    return None
+
+# each call of function handles size messages
+def measure(function, items, size=1):
+    repeat = (min_calls + len(items)*size - 1) // (len(items)*size)
+    gc.collect()
+    t0 = time.ticks_us()
+    for i in range(repeat):
+        for item in items:
+            function(item)
+    us = time.ticks_diff(time.ticks_us(), t0)
+    n = repeat * len(items) * size
+    return {'messages': n, 'us_per_message': us / n,
+            'messages_per_second': n * 1000000 / us if us else None,
+            'bytes_per_message': allocated(function, items, size)}
+
+# own ship from the first gps fix, so compute takes the full path
+def set_ownship(gps_lines):
+    for line in gps_lines:
+        data = decode_gps(line)
+        if data:
+            alarm.update_ownship(data, time.ticks_ms())
+            return
+
+# queues of clients drained as the sender tasks would, a batch at a time
+def drain(queues, limit, joiner, sent):
+    for queue in queues:
+        if queue.count >= queue.batch:
+            lines = queue.take(limit)
+            joiner.join(lines)
+            queue.done(len(lines))
+            sent(lines)
+
+class Finished(Exception):
+    pass
+
+# run an ingest task over the lines, a piece of alloc_calls lines per step
+# so allocation can be measured on one piece like the single stages
+def ingest(task, lines, clients):
+    wireless.nmea_queues[:] = [sendqueue.SendQueue(wireless.nmea_queue_size, wireless.nmea_policy,
+                                                   0, wireless.nmea_batch) for i in range(clients)]
+    web.ws_queues[:] = [sendqueue.SendQueue(web.ws_queue_size, web.ws_policy,
+                                            0, web.ws_batch) for i in range(clients)]
+    feed = []
+    async def readline(uart):
+        drain(wireless.nmea_queues, wireless.nmea_segment_size, b'', latency.sent_tcp)
+        drain(web.ws_queues, web.ws_frame_size, '', latency.sent_ws)
+        if not feed:
+            raise Finished
+        return feed.pop()
+    ais_monitor.readline = readline
+
+    # the task never waits as the stand-in uart is empty, so it runs to the
+    # end of the lines in one step
+    def run(lines):
+        feed[:] = lines
+        feed.reverse()
+        try:
+            task().send(None)
+        except Finished:
+            pass
+    size = min(alloc_calls, len(lines))
+    pieces = [lines[i:i+size] for i in range(0, len(lines) - size + 1, size)]
+    result = measure(run, pieces, size)
+    result['frames'] = sum(q.frames for q in wireless.nmea_queues + web.ws_queues)
+    wireless.nmea_queues[:] = []
+    web.ws_queues[:] = []
+    return result
+
+def run(name, seconds):
+    sentences = traffic.sentences(name, seconds)
+    ais = [line for t, uart, line in sentences if uart == 0]
+    gps = [line for t, uart, line in sentences if uart == 1]
+    set_ownship(gps)
+    packets = {} # multipart messages are reassembled across calls
+    decoded = [r[0] for r in [decode_ais(line, packets, False) for line in ais] if r]
+
+    results = {}
+    results['check_nmea_cksum'] = measure(lambda line: nmea.check_nmea_cksum(line, False),
+                                          ais + gps)
+    results['decode_ais'] = measure(lambda line: decode_ais(line, packets, False), ais)
+    results['decode_gps'] = measure(decode_gps, gps)
+    results['alarm.compute'] = measure(alarm.compute, decoded)
+    results['receive_gps'] = ingest(ais_monitor.receive_gps, gps, 1)
+    for clients in client_counts:
+        results['receive_ais %d clients' % clients] = ingest(ais_monitor.receive_ais, ais, clients)
+    latency.enable(1)
+    results['receive_ais %d traced' % traced_clients] = ingest(ais_monitor.receive_ais, ais,
+                                                               traced_clients)
+    latency.enable(0)
+    return {'sentences_per_second': len(sentences) / seconds, 'results': results}
+
+def main():
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'bench-%s.json' % sys.implementation.name
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    report = {'implementation': sys.implementation.name,
+              'version': '.'.join(str(v) for v in sys.implementation.version[:3]),
+              'platform': sys.platform, 'time': int(time.time()),
+              'traffic_seconds': seconds, 'scenarios': {}}
+
+    # alarms are rate limited and only print, keep the table readable
+    sound_alarm = alarm.alarm
+    alarm.alarm = lambda index: None
+    for name in ('quiet', 'harbour'):
+        # ingest prints each damaged sentence, as it would on the console
+        stdout = sys.stdout
+        if not micropython:
+            sys.stdout = open(os.devnull, 'w')
+        scenario = run(name, seconds)
+        if not micropython:
+            sys.stdout.close()
+            sys.stdout = stdout
+        report['scenarios'][name] = scenario
+        print('%s traffic, %.1f sentences/s' % (name, scenario['sentences_per_second']))
+        for bench, r in scenario['results'].items():
+            b = r['bytes_per_message']
+            print('  %-20s %9.1f us %9d msgs/s %s' % (bench, r['us_per_message'],
+                                                    r['messages_per_second'],
+                                                    '' if b is None else '%7.1f bytes' % b))
+    alarm.alarm = sound_alarm
+
+    with open(filename, 'w') as f:
+        json.dump(report, f)
+    print('results written to', filename)
+
+if __name__ == '__main__':
+    main()
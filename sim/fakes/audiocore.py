@@ -0,0 +1,17 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# stand-in for circuitpython audiocore on the host
+
+class RawSample:
+    def __init__(self, buffer, sample_rate=8000):
+        self.buffer = buffer
+        self.sample_rate = sample_rate
+
+class WaveFile:
+    def __init__(self, f):
+        self.file = f
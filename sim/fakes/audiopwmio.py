@@ -0,0 +1,22 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# stand-in for circuitpython audiopwmio on the host, records what is played
+import time
+
+plays = [] # (ticks_ms, sample)
+
+class PWMAudioOut:
+    def __init__(self, pin):
+        self.playing = False
+
+    def play(self, sample, loop=False):
+        plays.append((time.ticks_ms(), sample))
+        self.playing = True
+
+    def stop(self):
+        self.playing = False
@@ -0,0 +1,9 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# stand-in for the circuitpython board module on the host
+GP14 = 14
@@ -0,0 +1,17 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# settings for the host simulation, in place of the config saved on flash
+config = {'mute': False, 'proximity_dist': 1, 'tcpa_time': 10,
+          'tcpa_dist': 2, 'anchor': False, 'anchor_radius': 30, 'ssid': '',
+          'psk': '', 'ap': False, 'nmea_port': 20110, 'udp_mode': None,
+          'tracklog': True}
+
+writes = 0
+def write():
+    global writes
+    writes += 1
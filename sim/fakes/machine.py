@@ -0,0 +1,99 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# stand-in for the micropython machine module on the host.  Pins and uarts
+# are registered so the simulation can drive inputs and record outputs.
+import time
+
+events = [] # (ticks_ms, pin id, value) of every output change
+pins = {}
+uarts = {}
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 2
+
+    def __init__(self, id, mode=IN, pull=None):
+        self.id = id
+        self.mode = mode
+        self.level = 0 if mode == Pin.OUT else 1 # inputs are pulled up
+        pins[id] = self
+
+    def value(self, v=None):
+        if v is None:
+            return self.level
+        v = 1 if v else 0
+        if v != self.level and self.mode == Pin.OUT:
+            events.append((time.ticks_ms(), self.id, v))
+        self.level = v
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    high = on
+    low = off
+
+# received bytes wait in a buffer of rxbuf bytes like the real uart, bytes
+# fed while it is full are lost and counted
+class UART:
+    def __init__(self, id, baudrate=9600, tx=None, rx=None):
+        self.id = id
+        self.baudrate = baudrate
+        self.rx = bytearray()
+        self.rxbuf = 256
+        self.overrun = 0
+        self.written = bytearray()
+        uarts[id] = self
+
+    def init(self, baudrate=None, bits=8, parity=None, stop=1, timeout=0, rxbuf=256):
+        if baudrate:
+            self.baudrate = baudrate
+        self.rxbuf = rxbuf
+
+    def feed(self, data):
+        space = self.rxbuf - len(self.rx)
+        if len(data) > space:
+            self.overrun += len(data) - space
+            data = data[:space]
+        self.rx += data
+
+    def any(self):
+        return len(self.rx)
+
+    def readinto(self, buf):
+        count = min(len(buf), len(self.rx))
+        if not count:
+            return None
+        buf[:count] = self.rx[:count]
+        del self.rx[:count]
+        return count
+
+    def write(self, data):
+        self.written += data
+        return len(data)
+
+# records the longest time between feeds, the real one resets the pico
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        self.timeout = timeout
+        self.last = time.ticks_ms()
+        self.longest = 0
+
+    def feed(self):
+        t = time.ticks_ms()
+        self.longest = max(self.longest, t - self.last)
+        self.last = t
+
+resets = 0
+def reset():
+    global resets
+    resets += 1
+    raise SystemExit('machine.reset')
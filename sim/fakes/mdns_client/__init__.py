@@ -0,0 +1,12 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# stand-in for mdns_client on the host, nothing is sent
+
+class Client:
+    def __init__(self, address):
+        self.address = address
@@ -0,0 +1,16 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# stand-in for mdns_client.responder on the host, records advertisements
+advertised = []
+
+class Responder:
+    def __init__(self, client, own_ip=None, host=None):
+        self.client = client
+
+    def advertise(self, protocol, service, port=None, **kwargs):
+        advertised.append((protocol, service, port))
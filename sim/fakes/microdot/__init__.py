@@ -0,0 +1,50 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+# stand-in for microdot on the host.  No http server is run, the
+# simulation calls the routes directly with a Request.
+import asyncio
+
+class Request:
+    def __init__(self, path='/', method='GET', headers=None, form=None, args=None):
+        self.path = path
+        self.method = method
+        self.headers = headers or {}
+        self.form = form or {}
+        self.args = args or {}
+        self.sock = (None, None)
+        self.websocket = None # given by the simulation for websocket routes
+
+class Response:
+    default_content_type = 'text/plain'
+
+    def __init__(self, body='', status_code=200, headers=None):
+        self.body = body
+        self.status_code = status_code
+        self.headers = dict(headers or {})
+
+def send_file(filename, status_code=200, content_type=None, stream=None,
+              max_age=None, compressed=False, file_extension=''):
+    with open(filename + file_extension, 'rb') as f:
+        response = Response(f.read(), status_code)
+    if max_age is not None:
+        response.headers['Cache-Control'] = 'max-age=%d' % max_age
+    if compressed:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+class Microdot:
+    def __init__(self):
+        self.routes = {}
+
+    def route(self, path, methods=['GET']):
+        def decorator(f):
+            self.routes[path] = f
+            return f
+        return decorator
+
+    async def start_server(self, host='0.0.0.0', port=5000, debug=False):
+        await asyncio.Event().wait()
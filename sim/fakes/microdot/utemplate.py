@@ -0,0 +1,14 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+# stand-in for microdot.utemplate on the host, the page is not rendered
+
+class Template:
+    def __init__(self, template):
+        self.template = template
+
+    def render(self, *args, **kwargs):
+        return '<!-- %s %r -->' % (self.template, kwargs)
@@ -0,0 +1,13 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+# stand-in for microdot.websocket on the host, the simulation gives each
+# request the websocket it should use
+
+def with_websocket(f):
+    async def wrapper(request, *args, **kwargs):
+        return await f(request, request.websocket, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,17 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# stand-in for the micropython module on the host
+
+def const(x):
+    return x
+
+def mem_info(verbose=False):
+    pass
+
+def alloc_emergency_exception_buf(size):
+    pass
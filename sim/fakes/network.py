@@ -0,0 +1,38 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# stand-in for the network module on the host, always connected
+STA_IF = 0
+AP_IF = 1
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self.is_active = False
+
+    def active(self, a=None):
+        if a is None:
+            return self.is_active
+        self.is_active = a
+
+    def connect(self, ssid=None, key=None):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def isconnected(self):
+        return True
+
+    def status(self):
+        return 3 # got ip
+
+    def ifconfig(self):
+        return ('127.0.0.1', '255.0.0.0', '127.0.0.1', '127.0.0.1')
+
+    def config(self, **kwargs):
+        pass
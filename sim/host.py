@@ -0,0 +1,38 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+# run the pico code under cpython: the stand-in modules in sim/fakes and the
+# sources in src go on the path, and the few micropython additions to time,
+# asyncio and gc that the code uses are provided.  install() must be called
+# before importing anything from src.
+import sys, os, time, asyncio, gc
+
+sim_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.join(sim_dir, '..', 'src')
+
+def install():
+    sys.path[:0] = [os.path.join(sim_dir, 'fakes'), src_dir, sim_dir]
+
+    t0 = time.monotonic()
+    def ticks_ms():
+        return int((time.monotonic() - t0)*1000)
+    def ticks_us():
+        return int((time.monotonic() - t0)*1000000)
+    def ticks_diff(a, b):
+        return a - b
+    def ticks_add(a, b):
+        return a + b
+    time.ticks_ms = ticks_ms
+    time.ticks_us = ticks_us
+    time.ticks_diff = ticks_diff
+    time.ticks_add = ticks_add
+    time.sleep_ms = lambda ms: time.sleep(ms/1000)
+    time.sleep_us = lambda us: time.sleep(us/1000000)
+
+    asyncio.sleep_ms = lambda ms: asyncio.sleep(ms/1000)
+
+    gc.mem_free = lambda: 0
+    gc.mem_alloc = lambda: 0
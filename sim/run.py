@@ -0,0 +1,218 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# run the whole ais monitor under cpython, with synthetic or recorded nmea
+# fed into the stand-in uarts, real tcp clients on the nmea port and
+# simulated websocket clients.  Leds, alarms, sound and what every client
+# received are recorded, along with event loop lag and cpu use.
+#
+#   python3 sim/run.py --traffic harbour --duration 30 --tcp 2 --ws 2
+import sys, os, time, json, asyncio, argparse, tempfile
+import host
+
+parser = argparse.ArgumentParser(description='simulate the ais monitor on the host')
+parser.add_argument('--traffic', default='harbour', choices=('quiet', 'harbour'))
+parser.add_argument('--log', help='recorded nmea to play instead of synthetic traffic')
+parser.add_argument('--rate', type=float, default=20, help='sentences per second of --log')
+parser.add_argument('--speed', type=float, default=1, help='feed traffic this many times faster')
+parser.add_argument('--duration', type=float, default=20, help='seconds of traffic')
+parser.add_argument('--seed', type=int, default=1)
+parser.add_argument('--tcp', type=int, default=1, help='nmea tcp clients')
+parser.add_argument('--ws', type=int, default=1, help='nmea websocket clients')
+parser.add_argument('--stalled', type=int, default=0, help='websocket clients that never read')
+parser.add_argument('--targets-ws', type=int, default=0, help='decoded target websocket clients')
+parser.add_argument('--stats-ws', type=int, default=0, help='runtime statistics websocket clients')
+parser.add_argument('--latency', type=int, default=0, help='trace one in this many ais sentences')
+parser.add_argument('--json', help='write the results to this file')
+parser.add_argument('--verbose', action='store_true', help='show output of the monitor')
+
+class WebSocket:
+    def __init__(self, stalled=False):
+        self.stalled = stalled
+        self.closed = asyncio.Event()
+        self.frames = self.lines = self.bytes = 0
+
+    async def send(self, data):
+        if self.stalled:
+            await self.closed.wait()
+        if self.closed.is_set():
+            raise OSError('websocket closed')
+        self.frames += 1
+        self.bytes += len(data)
+        self.lines += data.count('\n')
+
+    async def receive(self):
+        await self.closed.wait()
+        raise OSError('websocket closed')
+
+    async def close(self):
+        self.closed.set()
+
+    def result(self):
+        return {'frames': self.frames, 'lines': self.lines, 'bytes': self.bytes,
+                'closed': self.closed.is_set()}
+
+# the socket under a websocket, which the server may abort
+class Stream:
+    def __init__(self, ws):
+        self.ws = ws
+
+    def close(self):
+        self.ws.closed.set()
+
+def connect_websocket(app, path, ws):
+    from microdot import Request
+    request = Request(path)
+    request.websocket = ws
+    request.sock = (None, Stream(ws))
+    return asyncio.create_task(app.routes[path](request))
+
+def percentiles(values, points=(50, 95, 99)):
+    if not values:
+        return {}
+    values = sorted(values)
+    result = {'p%d' % p: values[min(len(values)*p//100, len(values)-1)] for p in points}
+    result['max'] = values[-1]
+    result['mean'] = sum(values)/len(values)
+    return result
+
+# event loop lag, how late a short sleep wakes up
+async def lag_probe(lags, period=.01):
+    while True:
+        t = time.perf_counter()
+        await asyncio.sleep(period)
+        lags.append((time.perf_counter() - t - period)*1000)
+
+async def feed(sentences, speed, fed):
+    import machine
+    start = time.perf_counter()
+    for t, uart, line in sentences:
+        delay = start + t/speed - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        machine.uarts[uart].feed(line)
+        fed[line] = time.perf_counter()
+
+async def tcp_client(port, fed, result, latencies):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            result['lines'] += 1
+            result['bytes'] += len(line)
+            t = fed.get(line)
+            if t:
+                latencies.append((time.perf_counter() - t)*1000)
+    except (OSError, asyncio.CancelledError):
+        pass
+    writer.close()
+
+async def simulate(args, sentences):
+    import machine, config, alarm, targets, web, sound, leds, audiopwmio, ais_monitor, stats
+    from mdns_client import responder
+
+    alarms = []
+    sound_alarm = alarm.alarm
+    def record_alarm(index):
+        alarms.append((time.ticks_ms(), index))
+        sound_alarm(index)
+    alarm.alarm = record_alarm
+
+    ais_monitor.start()
+    await asyncio.sleep(.5) # servers start
+
+    lags = []
+    tasks = [asyncio.create_task(lag_probe(lags))]
+    fed = {}
+    tcp = [{'lines': 0, 'bytes': 0} for i in range(args.tcp)]
+    tcp_latency = []
+    for result in tcp:
+        tasks.append(asyncio.create_task(tcp_client(config.config['nmea_port'], fed,
+                                                    result, tcp_latency)))
+    ws = [WebSocket() for i in range(args.ws)]
+    ws += [WebSocket(True) for i in range(args.stalled)]
+    targets_ws = [WebSocket() for i in range(args.targets_ws)]
+    stats_ws = [WebSocket() for i in range(args.stats_ws)]
+    for w in ws:
+        tasks.append(connect_websocket(web.app, '/ws', w))
+    for w in targets_ws:
+        tasks.append(connect_websocket(web.app, '/ws/targets', w))
+    for w in stats_ws:
+        tasks.append(connect_websocket(web.app, '/ws/stats', w))
+
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    await feed(sentences, args.speed, fed)
+    await asyncio.sleep(1) # let queues drain
+    cpu = time.process_time() - cpu0
+    wall = time.perf_counter() - t0
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.sleep(.2) # servers see the clients close
+
+    led_names = {pin: name for name, pin in leds.led_indicies.items()}
+    led_changes = {}
+    for t, pin, v in machine.events:
+        name = led_names.get(pin, str(pin))
+        led_changes[name] = led_changes.get(name, 0) + 1
+    alarm_counts = {}
+    for t, index in alarms:
+        alarm_counts[index] = alarm_counts.get(index, 0) + 1
+    sounds = {}
+    for t, sample in audiopwmio.plays:
+        name = [name for name, s in sound.tones.samples.items() if s is sample]
+        name = name[0] if name else str(sample)
+        sounds[name] = sounds.get(name, 0) + 1
+    return {
+        'traffic': args.log or args.traffic, 'speed': args.speed,
+        'duration': wall, 'cpu_percent': cpu*100/wall,
+        'fed': {'ais': sum(1 for s in sentences if s[1] == 0),
+                'gps': sum(1 for s in sentences if s[1] == 1)},
+        'uart_overrun_bytes': {u: machine.uarts[u].overrun for u in machine.uarts},
+        'ingest': dict(ais_monitor.ingest_stats),
+        'idle_percent': ais_monitor.idle_per,
+        'targets': len(targets.index),
+        'alarms': alarm_counts,
+        'sounds': sounds,
+        'led_changes': led_changes,
+        'watchdog_longest_ms': ais_monitor.wdt.longest,
+        'loop_lag_ms': percentiles(lags),
+        'tcp': tcp, 'tcp_latency_ms': percentiles(tcp_latency),
+        'websockets': [w.result() for w in ws],
+        'target_websockets': [w.result() for w in targets_ws],
+        'stats_websockets': [w.result() for w in stats_ws],
+        'stats': stats.update(),
+        'mdns': responder.advertised,
+    }
+
+def main():
+    args = parser.parse_args()
+    host.install()
+    import traffic
+    if args.log:
+        sentences = traffic.recorded(args.log, args.rate, args.duration)
+    else:
+        sentences = traffic.sentences(args.traffic, args.duration, args.seed)
+
+    os.chdir(tempfile.mkdtemp(prefix='ais_sim')) # the track log is written here
+    if not args.verbose:
+        sys.stdout = open(os.devnull, 'w')
+    import config
+    config.config['latency_sample'] = args.latency
+    import ais_monitor # creates the uarts and pins
+    results = asyncio.run(simulate(args, sentences))
+
+    text = json.dumps(results, indent=1, default=str)
+    print(text, file=sys.__stdout__)
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(text)
+
+if __name__ == '__main__':
+    main()
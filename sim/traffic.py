@@ -0,0 +1,181 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+# synthetic nmea traffic for the simulation and benchmarks: own ship and
+# targets moving in straight lines, each target reporting at the rate a
+# real transponder would.  One target is on a collision course so alarms
+# are raised.  Ships also send static data, class A as two fragment type 5
+# messages and class B as type 24 parts, and the harbour has base stations
+# (type 4) and aids to navigation (type 21), which the monitor skips.  A
+# small share of ais sentences is corrupted, failing the checksum or cut
+# short.  Positions are encoded with tracklog's nmea exporter.  Runs under
+# cpython or the micropython unix port.
+import math, random
+if __name__ == '__main__':
+    import host
+    host.install()
+import tracklog
+
+lat0, lon0 = 48.4, -123.4
+epoch = 1700000000 # utc of time 0
+static_period = 360 # seconds between static data reports
+corrupt = 0.005 # share of ais sentences damaged on the way
+
+class Ship:
+    def __init__(self, mmsi, x, y, sog, cog, period, message_type=1):
+        self.mmsi = mmsi
+        self.x, self.y = x, y # nautical miles from the origin
+        self.sog, self.cog = sog, cog
+        self.period = period # seconds between reports
+        self.message_type = message_type
+
+    def record(self, t, kind='ais'):
+        h = t / 3600
+        x = self.x + self.sog*math.sin(math.radians(self.cog))*h
+        y = self.y + self.sog*math.cos(math.radians(self.cog))*h
+        return {'kind': kind, 'utc': epoch + t, 'message_type': self.message_type,
+                'mmsi': self.mmsi, 'lat': lat0 + y/60,
+                'lon': lon0 + x/60/math.cos(math.radians(lat0)),
+                'sog': self.sog, 'cog': self.cog}
+
+# a message of (value, bits) fields as sentences of at most 60 payload
+# characters, multipart messages numbered by seq
+def ais_sentences(fields, seq=0):
+    payload, pad = tracklog.ais_payload(fields)
+    count = (len(payload) + 59) // 60
+    result = []
+    for i in range(count):
+        part = payload[i*60:(i+1)*60]
+        body = 'AIVDM,%d,%d,%s,A,%s,%d' % (count, i + 1, seq if count > 1 else '',
+                                          part, pad if i == count - 1 else 0)
+        result.append(tracklog.nmea_sentence(body, '!'))
+    return result
+
+# static and voyage data of a ship, text fields are left blank
+def static_sentences(ship, seq):
+    if ship.message_type == 18: # class B sends two single sentence parts
+        return (ais_sentences(((24, 6), (0, 2), (ship.mmsi, 30), (0, 2), (0, 120))) +
+                ais_sentences(((24, 6), (0, 2), (ship.mmsi, 30), (1, 2), (70, 8),
+                               (0, 42), (0, 42), (0, 30), (0, 6))))
+    return ais_sentences(((5, 6), (0, 2), (ship.mmsi, 30), (0, 2), (0, 30), (0, 42),
+                          (0, 120), (70, 8), (0, 30), (0, 4), (0, 20), (0, 8),
+                          (0, 120), (0, 1), (0, 1)), seq)
+
+# base station report and aid to navigation
+def station_sentences(mmsi, message_type):
+    lon, lat = int(lon0*600000), int(lat0*600000)
+    if message_type == 4:
+        return ais_sentences(((4, 6), (0, 2), (mmsi, 30), (2023, 14), (11, 4), (14, 5),
+                              (0, 5), (0, 6), (0, 6), (1, 1), (lon, 28), (lat, 27),
+                              (7, 4), (0, 10), (0, 1), (0, 19)))
+    return ais_sentences(((21, 6), (0, 2), (mmsi, 30), (1, 5), (0, 120), (1, 1),
+                          (lon, 28), (lat, 27), (0, 30), (7, 4), (60, 6), (0, 1),
+                          (0, 8), (0, 1), (0, 1), (0, 1), (0, 1)))
+
+# flip a payload character, which fails the checksum, or cut the payload
+# to a few characters under a valid checksum, as a faulty receiver might
+def damage(line):
+    fields = line[1:line.index('*')].split(',')
+    payload = fields[5]
+    if random.uniform(0, 1) < .5:
+        c = 'A' if payload[1] != 'A' else 'B'
+        return line.replace(payload, payload[0] + c + payload[2:])
+    fields[5] = payload[:3]
+    return tracklog.nmea_sentence(','.join(fields), '!')
+
+# own ship and the targets of a scenario
+#  quiet: a few ships in open water
+#  harbour: a busy port, several hundred ships at anchor, moored or moving
+def scenario(name, seed=1):
+    random.seed(seed)
+    ownship = Ship(0, 0, 0, 5, 90, 1)
+    # closes from 3 miles to the south, meeting own ship in 10 minutes
+    ships = [Ship(316000001, 5*600/3600, -3, 18, 0, 2)]
+    counts = {'quiet': (4, 0, 0), 'harbour': (180, 80, 60)}[name]
+    mmsi = 316000002
+    for kind, count in zip(('a', 'b', 'moored'), counts):
+        for i in range(count):
+            r = random.uniform(1, 8 if name == 'quiet' else 5)
+            bearing = random.uniform(0, 2*math.pi)
+            x, y = r*math.sin(bearing), r*math.cos(bearing)
+            cog = random.uniform(0, 360)
+            if kind == 'a': # class a reports every 2 to 10 seconds underway
+                sog = random.uniform(3, 20)
+                ships.append(Ship(mmsi, x, y, sog, cog, 2 if sog > 14 else 10))
+            elif kind == 'b':
+                ships.append(Ship(mmsi, x, y, random.uniform(2, 8), cog, 30, 18))
+            else:
+                ships.append(Ship(mmsi, x, y, 0, cog, 180, 3))
+            mmsi += 1
+    if name == 'quiet':
+        ships += [Ship(mmsi + i, random.uniform(-6, 6), random.uniform(-6, 6), 0, 0, 180, 3)
+                  for i in range(2)]
+    return ownship, ships
+
+# (mmsi, message type, period) of shore stations
+def stations(name):
+    if name == 'quiet':
+        return []
+    return ([(3160001 + i, 4, 10) for i in range(2)] +
+            [(993160001 + i, 21, 180) for i in range(12)])
+
+# (seconds, uart, sentence) in time order for duration seconds, uart 0 is
+# ais and uart 1 gps
+def sentences(name, duration, seed=1):
+    ownship, ships = scenario(name, seed)
+    result = []
+    t = 0.5
+    while t < duration:
+        line = tracklog.nmea_record(ownship.record(t, 'gps'))
+        result.append((t, 1, line.encode() + b'\r\n'))
+        t += 1
+    ais = []
+    seq = 0
+    for ship in ships:
+        t = random.uniform(0, ship.period)
+        while t < duration:
+            ais.append((t, tracklog.nmea_record(ship.record(t))))
+            t += ship.period*random.uniform(.9, 1.1)
+        t = random.uniform(0, static_period)
+        while t < duration:
+            seq = (seq + 1) % 10
+            for line in static_sentences(ship, seq):
+                ais.append((t, line))
+                t += .001 # fragments follow each other in order
+            t += static_period
+    for mmsi, message_type, period in stations(name):
+        t = random.uniform(0, period)
+        while t < duration:
+            for line in station_sentences(mmsi, message_type):
+                ais.append((t, line))
+            t += period
+    for t, line in ais:
+        if random.uniform(0, 1) < corrupt:
+            line = damage(line)
+        result.append((t, 0, line.encode() + b'\r\n'))
+    result.sort(key=lambda s: s[0])
+    return result
+
+# sentences of a recorded log at rate per second, ais lines go to uart 0
+def recorded(filename, rate, duration=None):
+    result = []
+    with open(filename, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            t = len(result) / rate
+            if duration is not None and t >= duration:
+                break
+            uart = 0 if line[3:6] == b'VDM' or line[3:6] == b'VDO' else 1
+            result.append((t, uart, line + b'\r\n'))
+    return result
+
+if __name__ == '__main__':
+    for name in ('quiet', 'harbour'):
+        s = sentences(name, 60)
+        print(name, len(s)/60, 'sentences per second',
+              sum(len(l) for t, u, l in s)/60, 'bytes per second')
@@ -12,13 +12,22 @@ starttime = time.ticks_ms()
 import asyncio
 import machine, gc, micropython
 
-from decode_ais import decode_ais
+from decode_ais import decode_ais, ais_stats
 from decode_gps import decode_gps
 import alarm
-from non_blocking_readline import non_blocking_readline
+import targets
+import sound
+import non_blocking_readline
+from non_blocking_readline import readline
 import wireless
+import udp_nmea
 import leds
 import web
+import backlog
+import tracklog
+import stats
+import latency
+from config import config
 
 # these pins are used for buttons
 buttons = {'mute': machine.Pin(12, machine.Pin.PULL_UP),
@@ -26,8 +35,10 @@ buttons = {'mute': machine.Pin(12, machine.Pin.PULL_UP),
            'ap': machine.Pin(20, machine.Pin.PULL_UP)}
 
 # initialize uart0 to receive ais data at 38400 baud
+# the receive buffer holds about half a second of continuous traffic
+ais_rxbuf = 2048
 uart0 = machine.UART(0, baudrate=38400, tx=machine.Pin(0), rx=machine.Pin(1))
-uart0.init(bits=8, parity=None, stop=1, timeout=0)
+uart0.init(bits=8, parity=None, stop=1, timeout=0, rxbuf=ais_rxbuf)
 
 # initialize uart1 to receive gps messages at 4800 baud
 uart1 = machine.UART(1, baudrate=4800, tx=machine.Pin(4), rx=machine.Pin(5))
@@ -35,97 +46,175 @@ uart1.init(bits=8, parity=None, stop=1, timeout=0)
 
 idle_per = 100
 
-nearest_ships = {}
-def update_nearest(ais_data):
-    if not 'dist' in ais_data: # if target distance can be is calculated (by alarm compute)
-        return
-    dist = ais_data['dist']
-    if dist >= 10: # dont care about ships further than 10 miles
+gps_data = None
+gps_time = time.ticks_ms()
+busy_ms = 0 # time spent handling sentences, for the idle statistic
+
+# each ingest task handles at most budget_lines or budget_ms of sentences
+# before yielding, so bursts of traffic cannot starve the watchdog.  When
+# the uart buffer is filling up, sentences are still decoded for alarms but
+# forwarding to network clients is skipped until ingest catches up.
+budget_lines = 16
+budget_ms = 20
+rx_high_water = ais_rxbuf * 3 // 4
+ingest_stats = stats.counters # reported at /stats
+
+# time to handle each sentence, sweep and housekeeping pass, and how late
+# housekeeping wakes up, which shows how long other tasks hold the loop
+ais_loop = stats.histogram('ais')
+gps_loop = stats.histogram('gps')
+sweep_loop = stats.histogram('sweep')
+housekeeping_loop = stats.histogram('housekeeping')
+housekeeping_lag = stats.histogram('lag')
+
+# slice is [lines, start time] of the current run without yielding
+async def ingest_budget(uart, slice, t):
+    pending = uart.any()
+    if not pending: # next readline waits for data and lets other tasks run
+        slice[0], slice[1] = 0, t
         return
+    slice[0] += 1
+    if slice[0] >= budget_lines or t - slice[1] >= budget_ms:
+        ingest_stats['deferred'] += 1
+        await asyncio.sleep_ms(0)
+        slice[0], slice[1] = 0, time.ticks_ms()
 
-    mmsi = ais_data['mmsi'] # only keep track of 5 nearest ships for LED flashing calculation
-    if not mmsi in nearest_ships and len(nearest_ships) >= 5:
-        furthest = 0, None # nearest ships list full, compute farthest ship in nearest ships list
-        for ship in nearest_ships:
-            furthest = max(furthest[0], nearest_ships[ship][0]), ship
-        if dist > furthest[0]:
-            return # further than furthest near ship, abort
-        del nearest_ships[furthest[1]]
-    # update nearest ship list
-    nearest_ships[mmsi] = dist, t / 1000
-
-async def iteration():
-    gps_data = None
-    gps_time = time.ticks_ms()
+# one ais sentence through decoding, alarms, the target table, the track
+# log and forwarding to clients
+def handle_ais(ais_line, t0, forward, sampled):
+    # false for skipped message types and fragments of a multipart message
+    result = decode_ais(ais_line)
+    ais_data = urgent = False
+    if result:
+        ais_data, nmeas = result
+        if sampled:
+            latency.stamp(latency.DECODE)
+        ingest_stats['ais'] += 1
+        leds.on_timeout('ais')
+        urgent = alarm.compute(ais_data)
+        if sampled:
+            latency.stamp(latency.ALARM)
+        targets.update(ais_data, t0)
+        tracklog.ais(ais_data, t0)
+    # alarm targets are forwarded at once, the rest in batches
+    if forward:
+        wireless.write_nmea(ais_line, urgent)
+        if ais_data:
+            web.ais_data(ais_data, nmeas, urgent)
+    else:
+        ingest_stats['dropped'] += 1
+
+# each uart has its own task which wakes as soon as a line is complete.  A
+# sentence that raises an exception anywhere is counted and skipped, so one
+# corrupt line cannot end monitoring
+async def receive_ais():
+    global busy_ms
+    slice = [0, time.ticks_ms()]
+    while True:
+        ais_line = await readline(uart0)
+        sampled = latency.enabled and latency.begin()
+        t0 = time.ticks_ms()
+        pending = uart0.any()
+        if pending >= ais_rxbuf: # receive buffer full, bytes were lost
+            ingest_stats['overruns'] += 1
+        try:
+            handle_ais(ais_line, t0, pending < rx_high_water, sampled)
+        except Exception as e:
+            print('failed handling ais data', bytes(ais_line), e)
+            ingest_stats['ais_failed'] += 1
+        if sampled:
+            latency.end()
+        t1 = time.ticks_ms()
+        busy_ms += t1 - t0
+        stats.record(ais_loop, t1 - t0)
+        await ingest_budget(uart0, slice, t1)
+
+def handle_gps(gps_line):
+    global gps_data, gps_time
+    wireless.write_nmea(gps_line)
+    data = decode_gps(gps_line)
+    if data:
+        ingest_stats['gps'] += 1
+        gps_data = data
+        leds.on_timeout('gps', 10)
+        gps_time = time.ticks_ms()
+        alarm.update_ownship(gps_data, gps_time)
+        tracklog.gps(gps_data, gps_time)
+        web.gps_data(gps_line)
+        alarm.anchor(gps_data)
+
+async def receive_gps():
+    global busy_ms
+    slice = [0, time.ticks_ms()]
+    while True:
+        gps_line = await readline(uart1)
+        t0 = time.ticks_ms()
+        try:
+            handle_gps(gps_line)
+        except Exception as e:
+            print('failed handling gps data', bytes(gps_line), e)
+            ingest_stats['gps_failed'] += 1
+        t1 = time.ticks_ms()
+        busy_ms += t1 - t0
+        stats.record(gps_loop, t1 - t0)
+        await ingest_budget(uart1, slice, t1)
+
+# recompute cpa and tcpa for all tracked targets dead reckoned to now,
+# sweep_count targets every sweep_period keeps the cost per second fixed
+sweep_count = 96
+sweep_period = 250 # ms, covers the full table once a second
+async def sweep_targets():
+    global busy_ms
+    while True:
+        t = time.ticks_ms()
+        alarm.sweep(t, sweep_count)
+        t1 = time.ticks_ms()
+        busy_ms += t1 - t
+        stats.record(sweep_loop, t1 - t)
+        await asyncio.sleep_ms(sweep_period)
+
+# buttons, leds and the watchdog are handled periodically apart from ingest
+housekeeping_period = 100 # ms
+async def housekeeping():
+    global busy_ms, idle_per
     ships_led_time = 0
     button_toggle_times = {}
     for button in buttons:
         button_toggle_times[button] = time.ticks_ms()
 
+    idle_time = wake_time = time.ticks_ms()
     while True:
         t = time.ticks_ms()
-        # receive ais data
-        while True:
-            ais_line = non_blocking_readline(uart0)
-            if not ais_line:
-                break
-            await wireless.write_nmea(ais_line)
-            try:
-                ais_data, nmeas = decode_ais(ais_line)
-                print('decoded', ais_data)
-            except Exception as e:
-                import traceback
-                print(traceback.format_exc())
-                print('failed decoding ais data', ais_line, e)
-                ais_data = False
-            if ais_data:
-                leds.on_timeout('ais')
-                alarm.compute(gps_data, ais_data)
-                update_nearest(ais_data)
-                await web.ais_data(ais_data, nmeas)
-
-        # receive gps data
-        while True:
-            gps_line = non_blocking_readline(uart1)
-            if not gps_line:
-                break
-            await wireless.write_nmea(gps_line)
-            gps_data = decode_gps(gps_line)
-            if gps_data:
-                leds.on_timeout('gps', 10)
-                gps_time = time.ticks_ms()
-                web.gps_data(gps_line)
-                alarm.anchor(gps_data)
-
+        stats.record(housekeeping_lag, t - wake_time)
         # if no gps fix in 30 seconds, alarm!
         if t - gps_time > 30000:
             alarm.alarm(3)
 
-        # flash ships led based on closest ship
+        # flash ships led based on closest ship within 10 miles
         # once per second for 1 mile,  once every 10 seconds if 10 miles
         if t > ships_led_time:
-            mindist = 10
-            for mmsi in list(nearest_ships):
-                dist, shipt = nearest_ships[mmsi]
-                if t - shipt > 600:  # timeout nearest ships after 10 minutes
-                    del nearest_ships[mmsi] # remove ship
-                else:
-                    mindist = min(mindist, dist) # find nearest of nearest ships
-            if mindist < 10:
+            targets.expire(t) # timeout ships after 10 minutes
+            nearest = targets.nearest(1)
+            if nearest:
+                mindist = nearest[0][0]
                 leds.on_timeout('ships') # flash ships LED
                 # recompute flash period based on how far the nearest ship is
                 ships_led_time = t+mindist*1000 # in milliseconds
+            else:
+                ships_led_time = t+1000
 
-        # check buttons to toggle functions
+        # check buttons to toggle functions, at most once per second
         for name, pin in buttons.items():
             if not pin.value():
-                if t-button_toggle_times[name] > 1:
+                if t-button_toggle_times[name] > 1000:
                     value = alarm.config[name]
                     alarm.config[name] = not value
                     button_toggle_times[name] = t
                     leds.value(name, not value)
 
-                    if name == 'anchor':
+                    if name == 'mute' and not value:
+                        sound.stop()
+                    elif name == 'anchor':
                         alarm.anchor_pos = gps_data
                     elif name == 'ap':
                         wireless.reset()
@@ -133,47 +222,76 @@ async def iteration():
         # turn off leds that timed out
         leds.timeout(t)
 
-        # feed the watchdog
-        wdt.feed()
-        
-        # sleep for remainder of second
-        sleep_ms = max(1000-time.ticks_ms()+t, 0)
-        global idle_per
-        idle_per = (sleep_ms/10)*.01 + idle_per*.99
-        await asyncio.sleep_ms(sleep_ms)
+        # feed the watchdog while the tasks monitoring traffic still run,
+        # otherwise the pico resets rather than run without alarms
+        if not [task for task in watched if task.done()]:
+            wdt.feed()
+
+        # percentage of time not spent handling sentences, once per second
+        if t - idle_time >= 1000:
+            idle = max(100 - busy_ms*100/(t - idle_time), 0)
+            idle_per = idle*.01 + idle_per*.99
+            busy_ms = 0
+            idle_time = t
+
+        stats.record(housekeeping_loop, time.ticks_ms() - t)
+        stats.collect()
+        wake_time = time.ticks_ms() + housekeeping_period
+        await asyncio.sleep_ms(housekeeping_period)
 
 wdt = machine.WDT(timeout=8000)  # enable it with a timeout of 8s
+watched = [] # ingest and sweep tasks
+
+# figures of the other modules in each statistics report
+stats.source('tcp', wireless.nmea_stats) # lines per frame shows how well forwarding is batched
+stats.source('udp', udp_nmea.stats)
+stats.source('websockets', lambda: [queue.stats() for queue in web.ws_queues])
+stats.source('web_clients', lambda: dict(web.clients))
+stats.source('ais_decoder', lambda: dict(ais_stats))
+stats.source('targets', lambda: {'count': len(targets.index), 'evicted': targets.stats['evicted'],
+                                 'expired': targets.stats['expired'],
+                                 'ignored': targets.stats['ignored']})
+stats.source('backlog', lambda: {'count': backlog.size(), 'evicted': backlog.stats['evicted'],
+                                 'expired': backlog.stats['expired']})
+stats.source('tracklog', lambda: dict(tracklog.stats))
 
+# a new report for /stats and its websocket every stats_period
+stats_period = 10 # seconds
 async def report_statistics():
     while True:
-        t0 = time.ticks_ms()
-        F = gc.mem_free()
-        A = gc.mem_alloc()
-        print('mem stat', F, A)
         s = os.statvfs('/')
-        t1 = time.ticks_ms()
-        print(f"Free storage: {s[0]*s[3]/1024} KB", t1-t0)
-
-        print('iteration idle %', idle_per)
-        print('start', starttime/1000, 'run time ', (t1-starttime)/1000)
+        tracklog.check_space(s)
+        stats.update({'idle_percent': idle_per, 'storage_free_kb': s[0]*s[3]//1024,
+                      'discarded_lines': non_blocking_readline.discarded})
+        await asyncio.sleep(stats_period)
 
-        micropython.mem_info()
-        await asyncio.sleep(60)
+# create the tasks, called from main or from a host simulation which runs
+# its own event loop
+def start():
+    leds.value('pwr', True)
 
-leds.value('pwr', True)
+    # the track log takes part of the free flash, unless config tracklog is false
+    if config.get('tracklog', True):
+        tracklog.start(os.statvfs('/'))
 
-print('create tasks')
+    # trace one in latency_sample ais sentences through ingest to the clients
+    latency.enable(config.get('latency_sample', 0))
+    if latency.enabled:
+        stats.source('latency_us', latency.percentiles)
 
-# create tasks
-loop = asyncio.get_event_loop()
-loop.create_task(iteration())
-loop.create_task(report_statistics())
-loop.create_task(wireless.serve_nmea())
-loop.create_task(wireless.maintain_connection())
-loop.create_task(web.serve())
+    print('create tasks')
+    for task in (receive_ais, receive_gps, housekeeping, sweep_targets,
+                 sound.player, tracklog.writer, report_statistics,
+                 wireless.serve_nmea, wireless.maintain_connection, web.serve):
+        t = asyncio.create_task(task())
+        if task in (receive_ais, receive_gps, sweep_targets):
+            watched.append(t)
 
-print('run main loop')
-loop.run_forever()
+def main():
+    start()
+    print('run main loop')
+    asyncio.get_event_loop().run_forever()
 
-print('finished main loop??')
-machine.reset()
+    print('finished main loop??')
+    tracklog.flush()
+    machine.reset()
@@ -6,30 +6,31 @@
 # version 3 of the License, or (at your option) any later version.  
 
 import math, time
-from sound import play_mp3
+import sound
 from config import config
+import targets
 
 
 # 1 = target within 1 mile
 # 2 = potential target approaching
 # 3 = gps failure
-alarmtime = time.ticks_ms()
+# a collision course interrupts the other alarms sounding
+alarm_priority = {1: 1, 2: 3, 3: 2}
+alarm_sounds = {1: 'proximity', 2: 'cpa', 3: 'gps'}
+alarmtimes = {}
 def alarm(index):
-    # sound alarm at most every 10 seconds
+    # sound each alarm at most every 10 seconds
     t = time.ticks_ms()
-    global alarmtime
-    if t - alarmtime < 10*1000:
+    if index in alarmtimes and t - alarmtimes[index] < 10*1000:
         return
-    alarmtime = t
+    alarmtimes[index] = t
     
     print("ALARM", index)
-    if config['muted']:
+    if config['mute']:
         return
     
-    if index == 1:
-        play_mp3('slow.mp3')
-    else:
-        play_mp3('happy.mp3')
+    # queued for the sound player task, this does not wait for playback
+    sound.play_alarm(alarm_sounds[index], alarm_priority[index])
 
 #helper trigonomotry functions
 def sind(angle):
@@ -57,36 +58,73 @@ def simple_xy(lat1, lon1, lat2, lon2):
     y = (lat1-lat2)*60 # 60 nautical miles per degree
     return x, y
 
-# from gps data for boat, and ais position data, determine if a collision is imminent
-# if so, sound an alarm
-def compute(gps_data, ais_data):
-    if not gps_data or not 'sog' in ais_data:
-        return
+# own ship kinematics and alarm thresholds, updated once per gps fix so
+# each ais report only needs the target's velocity and a few multiply-adds
+class OwnShip:
+    __slots__ = ('valid', 't', 'lat', 'lon', 'xscale', 'vx', 'vy',
+                 'proximity_dist', 'tcpa_time', 'tcpa_dist')
+
+    def __init__(self):
+        self.valid = False
+
+ownship = OwnShip()
+
+def update_ownship(gps_data, t):
+    o = ownship
+    o.t = t # ticks_ms of the fix, for dead reckoning
+    o.lat, o.lon = gps_data['lat'], gps_data['lon']
+    o.xscale = cosd(o.lat) * 60 # nautical miles per degree of longitude
 
-    # now compute cpa and tcpa
     sog = gps_data['sog']
-    cog = gps_data['cog']
-    asog = ais_data['sog']
-    acog = ais_data['cog']
-    if 'rot' in ais_data:
-        acog += ais_data['rot']/60*5
+    cog = gps_data.get('cog', 0)
+    o.vx, o.vy = sog*sind(cog), sog*cosd(cog)
+
+    o.proximity_dist = config['proximity_dist']
+    o.tcpa_time = 60*config['tcpa_time']
+    o.tcpa_dist = config['tcpa_dist']
+    o.valid = True
+
+# from own ship position and velocity, and ais position data, determine if a
+# collision is imminent, if so, sound an alarm.  Returns True for a target
+# meeting an alarm condition so its messages can be forwarded at once.
+def compute(ais_data):
+    o = ownship
+    if not o.valid or not 'sog' in ais_data:
+        return False
 
     # x and y in relative distance in nautical miles to target
-    x, y = simple_xy(gps_data['lat'], gps_data['lon'],
-                     ais_data['lat'], ais_data['lon'])
+    x = o.xscale*resolv(o.lon - ais_data['lon'])
+    y = (o.lat - ais_data['lat'])*60 # 60 nautical miles per degree
 
     dist = hypot(x, y)
     ais_data['dist'] = dist
-    if dist < config['proximity_dist']: # target is < 1 mile away, make alarm
+    urgent = dist < o.proximity_dist
+    if urgent: # target is < 1 mile away, make alarm
         alarm(1)
 
-    # velocity vectors in x, y
-    bvx, bvy = sog*sind(cog), sog*cosd(cog)
-    avx, avy = asog*sind(acog), asog*cosd(acog)
-
-    # relative velocity of ais target
-    vx, vy = avx - bvx, avy - bvy
+    # now compute cpa and tcpa
+    asog = ais_data['sog']
+    acog = ais_data['cog']
+    if asog is None or acog is None: # course or speed not available
+        return urgent
+    if 'rot' in ais_data:
+        acog += ais_data['rot']/60*5
 
+    # relative velocity of ais target in x, y
+    acog = math.radians(acog)
+    vx, vy = asog*math.sin(acog) - o.vx, asog*math.cos(acog) - o.vy
+
+    d, t = cpa_tcpa(x, y, vx, vy)
+    ais_data['cpa'] = d
+    ais_data['tcpa'] = t
+    if cpa_alarm(d, t):
+        alarm(2)
+        return True
+    return urgent
+
+# from relative position x, y (nautical miles) and relative velocity
+# vx, vy (knots) of a target, compute cpa in miles and tcpa in seconds
+def cpa_tcpa(x, y, vx, vy):
     # the formula for time of closest approach is when the
     # derivative of the distance with respect to time is zero
     # d = (t*vx+x)^2 + (t*vy+y)^2
@@ -102,30 +140,79 @@ def compute(gps_data, ais_data):
     d = hypot(t*vx - x, t*vy - y)
     
     # time till closest point of approach is in hours, convert to seconds
-    t *= 3600
+    return d, t*3600
 
+def cpa_alarm(d, t):
     if t < -30:  # tcpa is more than 30 seconds in past, no alarm
-        return
+        return False
 
-    if t > 60*config['tcpa_time']: # tcpa is more than 10 minutes in future, no alarm
-        return
+    if t > ownship.tcpa_time: # tcpa is more than 10 minutes in future, no alarm
+        return False
 
-    if d > config['tcpa_dist']: # cpa is more than 3 miles away, no alarm
-        return
+    if d > ownship.tcpa_dist: # cpa is more than 3 miles away, no alarm
+        return False
     
     # conditions allow for alarm
-    alarm(2)
+    return True
+
+# dead reckon tracked targets and own ship to time t and recompute range,
+# cpa and tcpa from the target table columns, so targets that report
+# rarely (class B every 30 seconds to 3 minutes) are still checked between
+# reports.  Each call covers count slots, continuing round the table on the
+# next call, so the cost per call is fixed whatever the number of targets.
+# Own ship is dead reckoned from the last fix only while it is recent, after
+# that the gps failure alarm sounds instead.
+sweep_cursor = 0
+ownship_timeout = 30000 # ms
+def sweep(t, count):
+    global sweep_cursor
+    o = ownship
+    if not o.valid or t - o.t > ownship_timeout:
+        return
 
+    NA = targets.NA
+    mmsi, lat, lon, seen = targets.mmsi, targets.lat, targets.lon, targets.seen
+    tvx, tvy, sog, cog = targets.vx, targets.vy, targets.sog, targets.cog
+    dist, cpa, tcpa = targets.dist, targets.cpa, targets.tcpa
+    capacity = targets.capacity
+
+    # own ship motion since the last fix, in nautical miles
+    dt = (t - o.t) / 3600000
+    ox, oy = o.vx*dt, o.vy*dt
+    slot = sweep_cursor
+    for i in range(min(count, capacity)):
+        slot += 1
+        if slot == capacity:
+            slot = 0
+        if not mmsi[slot]:
+            continue
+
+        # relative position at time t
+        dt = (t - seen[slot]) / 3600000
+        x = o.xscale*resolv(o.lon - lon[slot]) + ox - tvx[slot]*dt
+        y = (o.lat - lat[slot])*60 + oy - tvy[slot]*dt
+        d = hypot(x, y)
+        dist[slot] = d
+        if d < o.proximity_dist:
+            alarm(1)
+
+        if sog[slot] == NA or cog[slot] == NA:
+            continue
+        d, tc = cpa_tcpa(x, y, tvx[slot] - o.vx, tvy[slot] - o.vy)
+        cpa[slot], tcpa[slot] = d, tc
+        if cpa_alarm(d, tc):
+            alarm(2)
+    sweep_cursor = slot
+
+anchor_pos = None # set from gps when the anchor alarm is switched on
 def anchor(gps_data):
-    if not config['anchor']:
+    if not config['anchor'] or not anchor_pos:
         return
-    try:
-        x, y = simple_xy(anchor_pos['lat'], anchor_pos['lon'],
-                         gps_data['lat'], gps_data['lon'])
-        dist = hypot(x, y) * 1852 # convert to meters
-        if dist > config['anchor_radius']:
-            alarm(3)
-    
+    x, y = simple_xy(anchor_pos['lat'], anchor_pos['lon'],
+                     gps_data['lat'], gps_data['lon'])
+    dist = hypot(x, y) * 1852 # convert to meters
+    if dist > config['anchor_radius']:
+        alarm(3)
 
 def ticks_ms():
     try:
@@ -133,9 +220,19 @@ def ticks_ms():
     except:
         return int(time.time()*1000)
 
+# cost of compute per ais report, runs under cpython or micropython
+def benchmark(count=1000):
+    update_ownship({'lat': 45, 'lon': -70, 'sog': 5, 'cog': 90}, ticks_ms())
+    ais_data = {'lat': 45, 'lon': -70.1, 'sog': 5.1, 'cog': 90, 'rot': 0}
+    t0 = ticks_ms()
+    for i in range(count):
+        compute(ais_data)
+    t1 = ticks_ms()
+    print('compute', (t1 - t0)*1000/count, 'us per message')
+
 # for testing
 if __name__ == '__main__':
-    gps_data = {'latitude': 45, 'longitude': -70, 'sog': 5, 'cog': 90}
-    ais_data = {'latitude': 45, 'longitude': -70.1, 'sog': 5.1, 'cog': 90, 'rot': 0}
-    
-    compute_alarm(gps_data, ais_data)
+    update_ownship({'lat': 45, 'lon': -70, 'sog': 5, 'cog': 90}, ticks_ms())
+    ais_data = {'lat': 45, 'lon': -70.1, 'sog': 5.1, 'cog': 90, 'rot': 0}
+    compute(ais_data)
+    print(ais_data)
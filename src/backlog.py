@@ -0,0 +1,70 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# most recent nmea lines for each (message_type, mmsi), sent to new web
+# clients.  Entries live in time buckets so expiring old messages drops a
+# whole bucket at once, and the total number of entries is capped.
+bucket_count = 3
+bucket_period = 5*60*1000 # ms, messages expire after 10 to 15 minutes
+max_entries = 300
+
+buckets = [{} for i in range(bucket_count)] # key to (ticks_ms, lines)
+where = {} # key to index of the bucket holding it
+current = 0 # newest bucket
+bucket_start = None
+stats = {'expired': 0, 'evicted': 0}
+
+def drop_bucket(i, reason):
+    for key in buckets[i]:
+        del where[key]
+    stats[reason] += len(buckets[i])
+    buckets[i] = {}
+
+# advance to the bucket for time t, the oldest bucket is reused
+def rotate(t):
+    global current, bucket_start
+    if bucket_start is None or t < bucket_start: # first message or ticks wrapped
+        bucket_start = t
+    elapsed = t - bucket_start
+    if elapsed < bucket_period:
+        return
+    steps = min(elapsed // bucket_period, bucket_count)
+    bucket_start += elapsed - elapsed % bucket_period
+    for i in range(steps):
+        current = (current + 1) % bucket_count
+        drop_bucket(current, 'expired')
+
+def evict_oldest():
+    for i in range(1, bucket_count + 1):
+        bucket = buckets[(current + i) % bucket_count]
+        if bucket:
+            key = next(iter(bucket))
+            del bucket[key]
+            del where[key]
+            stats['evicted'] += 1
+            return
+
+def update(key, t, lines):
+    rotate(t)
+    i = where.get(key)
+    if i is None:
+        if len(where) >= max_entries:
+            evict_oldest()
+    elif i != current:
+        del buckets[i][key]
+    buckets[current][key] = t, lines
+    where[key] = current
+
+# lines of every entry from oldest to newest, each bucket is copied so
+# updates may continue while a client is being sent the snapshot
+def snapshot():
+    for i in range(1, bucket_count + 1):
+        for t, lines in list(buckets[(current + i) % bucket_count].values()):
+            yield lines
+
+def size():
+    return len(where)
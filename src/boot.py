@@ -1,2 +1,2 @@
 import ais_monitor
-
+ais_monitor.main()
@@ -14,77 +14,237 @@ def getticks():
     try:
         return time.ticks_ms()
     except:
-        return time.monotonic()/1000
+        return int(time.monotonic()*1000)
 
+# convert the 6 bit ascii armored payload line[start:end] into one byte per 6 bits
+armor_table = bytearray(256)
+for c in range(48, 120):
+    armor_table[c] = c - 48 if c <= 88 else c - 56
+translate = hasattr(b'', 'translate') # decode a whole payload in one call (cpython)
+
+def ais_armor(line, start, end, data):
+    if translate:
+        data.extend(bytes(line[start:end]).translate(armor_table))
+        return data
+    for i in range(start, end):
+        data.append(armor_table[line[i]])
+    return data
+
+# how much of each message type is decoded, consumers register what they use
+# with decode_level and message types nobody registered are skipped
+DECODE_SKIP = 0   # not decoded at all
+DECODE_HEADER = 1 # only message_type and mmsi
+DECODE_FULL = 2   # position reports are fully decoded
+decode_levels = {1: DECODE_FULL, 2: DECODE_FULL, 3: DECODE_FULL, # class A
+                 18: DECODE_FULL, 19: DECODE_FULL} # class B, for alarms
+
+def decode_level(message_types, level):
+    for message_type in message_types:
+        decode_levels[message_type] = max(decode_levels.get(message_type, DECODE_SKIP), level)
+
+
+# multipart messages are reassembled by channel and sequential message id
+# the table is bounded so lost or interleaved fragments cannot use up memory
 ais_packets = {}
-def decode_ais(line):
-    if line[3:6] != 'VDM':
-        return False
-    if not check_nmea_cksum(line):
+max_fragments = 12       # total fragments held for all incomplete messages
+fragment_timeout = 2000  # ms, fragments of a message arrive back to back
+ais_stats = {'parse_failed': 0, 'checksum_failed': 0, 'dropped': 0, 'timeout': 0, 'evicted': 0}
+
+def packet_fragments(packet):
+    return 1 if packet[2] is None else len(packet[2])
+
+def remove_packet(packets, key, reason=None):
+    packet = packets.pop(key)
+    if reason:
+        ais_stats[reason] += packet_fragments(packet)
+
+def expire_packets(packets, t):
+    count = 0
+    for key in list(packets):
+        if t - packets[key][0] > fragment_timeout:
+            remove_packet(packets, key, 'timeout')
+        else:
+            count += packet_fragments(packets[key])
+    return count
+
+def evict_oldest_packet(packets):
+    oldest = None
+    for key, packet in packets.items():
+        if oldest is None or packet[0] < packets[oldest][0]:
+            oldest = key
+    count = packet_fragments(packets[oldest])
+    remove_packet(packets, oldest, 'evicted')
+    return count
+
+# line is bytes or a memoryview over the uart buffer, fields are located by
+# index so no intermediate strings are created.  Lines kept for forwarding
+# (nmeas) are copied since the buffer is reused for the next line.
+def decode_ais(line, packets=ais_packets, verbose=True):
+    if len(line) < 16 or line[3] != 86 or line[4] != 68 or line[5] != 77: # VDM
         return False
     
+    # !AIVDM,fragcount,fragindex,seqid,channel,payload,pad*cksum
     try:
-        data = line[7:len(line)-3].split(',')
-        fragcount = int(data[0])
-        fragindex = int(data[1])
-        channel = data[3]
-        payload = data[4]
-        pad = data[5]
+        if line[6] != 44 or line[8] != 44 or line[10] != 44: # commas
+            raise ValueError('bad field')
+        fragcount = line[7] - 48
+        fragindex = line[9] - 48
+        i = 11
+        seqid = -1
+        if line[i] != 44:
+            seqid = line[i] - 48
+            i += 1
+        i += 1
+        channel = 0
+        if line[i] != 44:
+            channel = line[i]
+            i += 1
+        if line[i] != 44:
+            raise ValueError('bad channel')
+        start = i = i + 1
+        while line[i] != 44:
+            i += 1
+        end = i
+        if fragindex < 1 or fragindex > fragcount or fragcount > 9 or start == end:
+            raise ValueError('bad fragment')
+        message_type = armor_table[line[start]] if fragindex == 1 else None
     except Exception as e:
-        print('failed to decode', line, e)        
+        if verbose:
+            print('failed to decode', bytes(line), e)
+        ais_stats['parse_failed'] += 1
+        return False
+
+    # single fragment messages never enter the reassembly table
+    if fragcount == 1:
+        level = decode_levels.get(message_type, DECODE_SKIP)
+        if level == DECODE_SKIP:
+            return False
+        if not check_nmea_cksum(line, verbose):
+            ais_stats['checksum_failed'] += 1
+            return False
+        if end - start < 7: # too short for the message type and mmsi
+            ais_stats['parse_failed'] += 1
+            return False
+        if level != DECODE_FULL:
+            end = min(end, start + 7) # 42 bits covers message type and mmsi
+        result = decode_ais_data(ais_armor(line, start, end, bytearray()), level)
+        result['channel'] = chr(channel) if channel else ''
+        return result, [bytes(line)]
+
+    key = channel, seqid
+    if fragindex == 1:
+        t = getticks()
+        if key in packets: # previous message with this id never completed
+            remove_packet(packets, key, 'dropped')
+        count = expire_packets(packets, t)
+        while packets and count >= max_fragments:
+            count -= evict_oldest_packet(packets)
+
+        # classify from the first fragment before checksum or decoding
+        level = decode_levels.get(message_type, DECODE_SKIP)
+        if level == DECODE_SKIP:
+            packets[key] = [t, None, None, level, 2] # drop remaining fragments
+            return False
+        packets[key] = [t, bytearray(), [], level, 1]
+    elif not key in packets:
+        ais_stats['dropped'] += 1 # missing first fragment
+        return False
+
+    packet = packets[key]
+    if fragindex != packet[4]: # out of sequence, lost a fragment
+        remove_packet(packets, key, 'dropped')
+        ais_stats['dropped'] += 1
+        return False
+
+    packet[4] += 1
+    level = packet[3]
+    if level == DECODE_SKIP:
+        if fragindex == fragcount:
+            remove_packet(packets, key)
+        return False
+
+    if not check_nmea_cksum(line, verbose):
+        remove_packet(packets, key, 'dropped')
+        ais_stats['checksum_failed'] += 1
+        return False
 
     # generally now i == pad - 5
-    if not channel in ais_packets:
-        ais_packets[channel] = ([], [])
-
-    data = []
-    for byte in payload:
-        d = ord(byte) - 48
-        if d > 40:
-            d -= 8
-        for b in range(5,-1,-1):
-            if (1<<b) & d:
-                data.append(1)
-            else:
-                data.append(0)
-
-    pdata, nmeas = ais_packets[channel]
-    pdata += data
-    nmeas.append(line)
+    pdata, nmeas = packet[1], packet[2]
+    if level == DECODE_FULL:
+        ais_armor(line, start, end, pdata)
+    elif fragindex == 1:
+        ais_armor(line, start, min(end, start + 7), pdata)
+    nmeas.append(bytes(line))
 
     if fragindex == fragcount:
-        data, nmeas = ais_packets[channel]
-        result = decode_ais_data(data)
-        result['channel'] = channel
-        ais_packets[channel] = ([], [])
+        del packets[key]
+        if len(pdata) < 7:
+            ais_stats['parse_failed'] += 1
+            return False
+        result = decode_ais_data(pdata, level)
+        result['channel'] = chr(channel) if channel else ''
         return result, nmeas
     return False
 
+# decode recorded nmea (a log file or list of lines) with its own reassembly
+# table and no debug printing, yielding a tuple of fields per message
+# or the whole decoded dict if fields is None.  A corrupt line is counted
+# as parse_failed and skipped so one bad line cannot end a long replay.
+stream_fields = ('message_type', 'mmsi', 'lat', 'lon', 'sog', 'cog')
+def decode_stream(lines, fields=stream_fields):
+    packets = {}
+    for line in lines:
+        if type(line) is str:
+            line = line.encode()
+        i = line.find(b'!') # skip any timestamp logged before the sentence
+        if i < 0:
+            continue
+        if i:
+            line = line[i:]
+        try:
+            result = decode_ais(line, packets, False)
+        except Exception:
+            ais_stats['parse_failed'] += 1
+            continue
+        if not result:
+            continue
+        d = result[0]
+        if fields is None:
+            yield d
+        else:
+            yield tuple([d.get(field) for field in fields])
+
+def decode_many(lines, fields=stream_fields):
+    return list(decode_stream(lines, fields))
+
 def sign(x):
     return 1 if x >= 0 else -1
 
-def ais_n(bits, signed=False):
-    negative = False
-    if signed:
-        if bits[0]:
-            negative = True
-            bits = list(map(lambda x : 0 if x else 1, bits))
-        bits = bits[1:]
-            
-    result = 0
-    count = len(bits)
-    for i in range(count):
-        if bits[i]:
-            result |= (1<<(count-i-1))
-    if negative:
-        result = -(result + 1)
+# extract an integer field from the 6 bit data without building a list of bits
+# fields up to 30 bits never leave the small integer range
+def ais_n(data, start, count, signed=False):
+    i = start // 6
+    avail = 6 - start % 6
+    result = data[i] & ((1 << avail) - 1)
+    if avail >= count:
+        result >>= avail - count
+    else:
+        left = count - avail
+        while left >= 6:
+            i += 1
+            result = (result << 6) | data[i]
+            left -= 6
+        if left:
+            result = (result << left) | (data[i+1] >> (6 - left))
 
+    if signed and result >> (count - 1):
+        result -= 1 << count
     return result
 
-def ais_t(bits):
+def ais_t(data, start, count):
     result = ''
-    for i in range(0, bits, 6):
-        d = ais_n(bits[i:i+6])
+    for i in range(start, start + count, 6):
+        d = ais_n(data, i, 6)
         if d == 0:
             break
         if d <= 31:
@@ -92,65 +252,67 @@ def ais_t(bits):
         result += '%c' % d
     return result;
 
-def ais_rot(bits):
-    rot = ais_n(bits, True)
+def ais_rot(data, start):
+    rot = ais_n(data, start, 8, True)
     return sign(rot) * (rot / 4.733)**2
 
-def ais_sog(bits):
-    sog = ais_n(bits)
+def ais_sog(data, start):
+    sog = ais_n(data, start, 10)
     if sog == 1023:
         return None
     return sog/10.0
 
-def ais_cog(bits):
-    cog = ais_n(bits)
+def ais_cog(data, start):
+    cog = ais_n(data, start, 12)
     if cog == 3600:
         return None
     return cog / 10.0
 
-def ais_hdg(bits):
-    hdg = ais_n(bits)
+def ais_hdg(data, start):
+    hdg = ais_n(data, start, 9)
     if hdg == 511:
         return None
     return hdg
 
-def ais_ll(bits):
-    return round(ais_n(bits, True) / 600000.0, 8)
+def ais_ll(data, start, count):
+    return round(ais_n(data, start, count, True) / 600000.0, 8)
 
-def ais_ts(bits):
-    ts = ais_n(bits)
+def ais_ts(data, start):
+    ts = ais_n(data, start, 6)
     if ts >= 60:
         ts = None
     return getticks(), ts
 
 
-def decode_ais_data(data):
+def decode_ais_data(data, level=DECODE_FULL):
     # first byte is message type
-
-    message_type = ais_n(data[0:6]);
+    message_type = data[0]
     d = {'message_type': message_type,
-         'mmsi': ais_n(data[8:38]),
+         'mmsi': ais_n(data, 8, 30),
          'ticks_ms': getticks()}
     #print('message_type', d['message_type'])
-    if message_type in [1,2,3]:
-        d.update({#'status': ais_e(data[38:42]),
-                     'rot': ais_rot(data[42:50]),
-                     'sog': ais_sog(data[50:60]),
-                     #'pos_acc': ais_n(data[60:61]),
-                     'lon': ais_ll(data[61:89]),
-                     'lat':  ais_ll(data[89:116]),
-                     'cog': ais_cog(data[116:128]),
-                     #'hdg' = ais_hdg(data[128:137]),
-                     #'ts': ais_ts(data[137:143])
+    if level < DECODE_FULL:
+        return d
+
+    if message_type in [1,2,3] and len(data) >= 22: # 128 bits
+        d.update({#'status': ais_e(data, 38, 4),
+                     'rot': ais_rot(data, 42),
+                     'sog': ais_sog(data, 50),
+                     #'pos_acc': ais_n(data, 60, 1),
+                     'lon': ais_ll(data, 61, 28),
+                     'lat':  ais_ll(data, 89, 27),
+                     'cog': ais_cog(data, 116),
+                     #'hdg' = ais_hdg(data, 128),
+                     #'ts': ais_ts(data, 137)
         })
-    elif message_type in [18, 19]:
-        d.update({'sog': ais_sog(data[46:56]),
-                  #'pos_acc': ais_n(data[56:57]),
-                  'lon': ais_ll(data[57:85]),
-                  'lat':  ais_ll(data[85:112]),
-                  'cog': ais_cog(data[112:124]),
-                  #'hdg' = ais_hdg(data[124:133]),
-                  #'ts': ais_ts(data[133:139])
+    elif message_type in [18, 19] and len(data) >= 21: # 124 bits
+        d.update({'sog': ais_sog(data, 46),
+                  #'pos_acc': ais_n(data, 56, 1),
+                  'lon': ais_ll(data, 57, 28),
+                  'lat':  ais_ll(data, 85, 27),
+                  'cog': ais_cog(data, 112),
+                  #'hdg' = ais_hdg(data, 124),
+                  #'ts': ais_ts(data, 133)
         })
         
     return d
@@ -164,7 +326,7 @@ def test1():
     while True:
         line = non_blocking_readline(uart0)
         if line:
-            print(line.strip())
+            print(bytes(line).strip())
             t0 = time.ticks_ms()
             result = decode_ais(line)
             t1 = time.ticks_ms()
@@ -188,8 +350,57 @@ def test2():
     packets = ['!AIVDM,1,1,,A,B52e9Eh00>`aAVUGfPWQ3wgQnDlb,0*4E']
     ticks = getticks()
     for p in packets:
-        print(decode_ais(p))
+        print(decode_ais(p.encode()))
 
     print('took', getticks() - ticks, 'ms')
 
+# micro benchmark, runs under cpython or micropython
+def benchmark(count=200):
+    import gc
+    packets = [b'!AIVDM,1,1,,B,13MARih000wbAbJP0kr23aSV0<0g,0*73',
+               b'!AIVDM,1,1,,B,39NWtpm000wb=GBP19oqt9qn0Dtr,0*24',
+               b'!AIVDM,1,1,,A,B52e9Eh00>`aAVUGfPWQ3wgQnDlb,0*4E']
+    gc.collect()
+    try:
+        a0 = gc.mem_alloc()
+        gc.disable()
+    except AttributeError:
+        a0 = None # cpython
+    t0 = getticks()
+    for i in range(count):
+        for p in packets:
+            decode_ais(p)
+    t1 = getticks()
+    if a0 is not None:
+        a1 = gc.mem_alloc()
+        gc.enable()
+    n = count * len(packets)
+    print('decoded', n, 'messages in', t1 - t0, 'ms', (t1 - t0)*1000/n, 'us per message')
+    if a0 is not None:
+        print('allocated', (a1 - a0) / n, 'bytes per message')
+
+# corrupt lines in a replay are counted and skipped
+def test_stream():
+    good = b'!AIVDM,1,1,,B,13MARih000wbAbJP0kr23aSV0<0g,0*73'
+    lines = [good, b'!AIVDM,1,1,,A,1abc,0*77', b'1.5 !AIVDM,X,1,,A,13MARih000wbAbJP,0*00', good]
+    failed = ais_stats['parse_failed']
+    records = decode_many(lines)
+    assert len(records) == 2 and records[0] == records[1], records
+    assert ais_stats['parse_failed'] == failed + 2, ais_stats
+    print('decode_stream ok', records[0])
+
 #test2()
+
+# decode a recorded log on a host, eg: python3 decode_ais.py ais.log
+# without a log the stream test is run
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 2:
+        test_stream()
+        sys.exit(0)
+    t0 = getticks()
+    count = 0
+    with open(sys.argv[1], 'rb') as f:
+        for record in decode_stream(f):
+            count += 1
+    print('decoded', count, 'messages in', getticks() - t0, 'ms', ais_stats)
@@ -14,13 +14,15 @@ def decode_gps(line):
         minutes = n - degrees
         return degrees + minutes*10/6
 
-    if line[3:6] != 'RMC':
+    # other sentences are rejected from the raw bytes without decoding
+    if len(line) < 7 or line[3] != 82 or line[4] != 77 or line[5] != 67: # RMC
         return False
 
     if not check_nmea_cksum(line):
         return False
 
     try:
+        line = bytes(line).decode() # only rmc sentences are converted to a string
         data = line[7:len(line)-3].split(',')
         if data[1] == 'V':
             return False
@@ -38,6 +40,13 @@ def decode_gps(line):
         if data[7]:
             gps['cog'] = float(data[7])
 
+        # utc as ddmmyy and milliseconds of the day, for the track log
+        if data[0] and data[8]:
+            hms = float(data[0])
+            h, m = int(hms) // 10000, int(hms) // 100 % 100
+            gps['date'] = int(data[8])
+            gps['time'] = int(((h*60 + m)*60 + hms % 100)*1000 + .5)
+
         if data[9]:
             decl = float(data[9])
             if data[10] == 'W':
@@ -51,6 +60,6 @@ def decode_gps(line):
 
 # test packets
 if __name__ == '__main__':
-    packets = ['$GPRMC,210230,A,3855.4487,N,09446.0071,W,0.0,076.2,130495,003.8,E*69']
+    packets = [b'$GPRMC,210230,A,3855.4487,N,09446.0071,W,0.0,076.2,130495,003.8,E*69']
     for p in packets:
         print(decode_gps(p))
@@ -0,0 +1,91 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# optional latency tracing of ais sentences through the monitor.  One
+# sentence in sample_every is stamped with ticks_us when readline returns
+# it, then as its checksum passes, it is decoded, alarm.compute has seen it,
+# and it is first written to a tcp client and sent on a websocket.  Each
+# sample is microseconds since the read, kept in a fixed ring so tracing
+# allocates nothing.  Switched off, the ingest path only tests a flag.
+import time
+from array import array
+
+stages = ('checksum', 'decode', 'alarm', 'tcp', 'ws')
+CHECKSUM, DECODE, ALARM, TCP, WS = range(len(stages))
+ring_size = 256 # samples kept
+ring = array('i', [-1]*(ring_size*len(stages))) # -1 where a stage was not reached
+
+enabled = False
+sample_every = 16 # ais sentences, longer apart than the flush period of the clients
+sampling = False # only while the sampled sentence is in ingest
+countdown = 0
+samples = 0
+slot = 0 # index in ring of the current sample
+start_us = 0
+tcp_line = ws_line = None # the sampled sentence as queued for each kind of client
+
+# every is taken from the config, anything but a whole number switches off
+def enable(every):
+    global enabled, sample_every
+    try:
+        every = int(every)
+    except (TypeError, ValueError):
+        print('invalid latency sample period', every)
+        every = 0
+    enabled, sample_every = every > 0, every
+
+# called by ingest for each ais line when enabled, true if it is sampled
+def begin():
+    global countdown, sampling, samples, slot, start_us, tcp_line, ws_line
+    countdown -= 1
+    if countdown > 0:
+        return False
+    start_us = time.ticks_us()
+    countdown = sample_every
+    slot = samples % ring_size * len(stages)
+    for i in range(len(stages)):
+        ring[slot + i] = -1
+    samples += 1
+    tcp_line = ws_line = None # an earlier sample not yet sent misses these stages
+    sampling = True
+    return True
+
+def stamp(stage):
+    ring[slot + stage] = time.ticks_diff(time.ticks_us(), start_us)
+
+def end():
+    global sampling
+    sampling = False
+
+# called by the senders with each batch once it is sent
+def sent_tcp(lines):
+    global tcp_line
+    for line in lines:
+        if line is tcp_line:
+            stamp(TCP)
+            tcp_line = None
+
+def sent_ws(lines):
+    global ws_line
+    for line in lines:
+        if line is ws_line:
+            stamp(WS)
+            ws_line = None
+
+# p50, p95 and p99 microseconds from the read to each stage
+def percentiles():
+    count = min(samples, ring_size)
+    result = {'samples': samples, 'sample_every': sample_every}
+    for stage in range(len(stages)):
+        values = sorted(ring[i*len(stages) + stage] for i in range(count)
+                        if ring[i*len(stages) + stage] >= 0)
+        if not values:
+            continue
+        n = len(values)
+        result[stages[stage]] = {'count': n, 'p50': values[n*50//100],
+                                 'p95': values[n*95//100], 'p99': values[n*99//100]}
+    return result
@@ -5,22 +5,65 @@
 # License as published by the Free Software Foundation; either
 # version 3 of the License, or (at your option) any later version.  
 
-# nmea uses a simple xor checksum
+import stats
+import latency
+
+# nmea uses a simple xor checksum, computed directly on bytes
 def nmea_cksum(msg):
     value = 0
     for c in msg: # skip over the $ at the begining of the sentence
-        value ^= ord(c)
+        value ^= c
     return value & 255
 
-def check_nmea_cksum(line):
-    cksplit = line.split('*')
-    try:
-        computed = nmea_cksum(cksplit[0][1:])
-        lineck = int(cksplit[1], 16)
-        if computed == lineck:
-            return True
-        print('chekcsum faild', computed, lineck)
+def hex_digit(c):
+    if c >= 48 and c <= 57: # 0-9
+        return c - 48
+    c |= 32 # lower case
+    if c >= 97 and c <= 102: # a-f
+        return c - 87
+    return -1
+
+# line may be bytes or a memoryview, the checksum is computed in a single
+# pass up to the '*' without splitting the line.  Sentences with bytes over
+# 127 are rejected too, so accepted lines always decode as ascii text.
+def check_nmea_cksum(line, verbose=True):
+    computed = 0
+    seen = 0 # every byte or'd together
+    count = len(line)
+    i = 1 # skip over the $ at the begining of the sentence
+    while i < count:
+        c = line[i]
+        if c == 42: # *
+            break
+        computed ^= c
+        seen |= c
+        i += 1
+
+    if seen & 128:
+        if verbose:
+            print('failed checksum, not ascii', bytes(line))
+        stats.counters['checksum_failed'] += 1
         return False
-    except Exception as e:
-        print('failed checksum exception', e)
+
+    if i + 2 >= count: # need two hex digits after *
+        if verbose:
+            print('failed checksum, missing', bytes(line))
+        stats.counters['checksum_failed'] += 1
         return False
+
+    high, low = hex_digit(line[i+1]), hex_digit(line[i+2])
+    if high < 0 or low < 0:
+        if verbose:
+            print('failed checksum, invalid', bytes(line))
+        stats.counters['checksum_failed'] += 1
+        return False
+
+    lineck = high << 4 | low
+    if computed == lineck:
+        if latency.sampling:
+            latency.stamp(latency.CHECKSUM)
+        return True
+    if verbose:
+        print('chekcsum faild', computed, lineck)
+    stats.counters['checksum_failed'] += 1
+    return False
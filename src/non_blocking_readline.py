@@ -5,20 +5,86 @@
 # License as published by the Free Software Foundation; either
 # version 3 of the License, or (at your option) any later version.  
 
+import sys
+import asyncio
 
+# lines are read in place into two fixed buffers per uart so nothing is
+# allocated per line.  The returned memoryview is only valid until the
+# next call for the same uart, use bytes(line) to keep a copy.
+line_length = 128 # nmea sentences are at most 82 characters
 buffers = {}
+discarded = 0 # over long lines thrown away
+
+def uart_buffer(uart):
+    if not uart in buffers: # buffer, spare buffer, start, end, scanned up to
+        buffers[uart] = [memoryview(bytearray(line_length)),
+                         memoryview(bytearray(line_length)), 0, 0, 0]
+    return buffers[uart]
+
+# return the next complete line already in the buffer, otherwise move the
+# partial line to the front of the spare buffer ready to read more after it
+def next_line(state):
+    global discarded
+    buf, spare, start, end, scan = state
+    for i in range(scan, end):
+        if buf[i] == 10: # Check if the line is complete
+            state[2] = state[4] = i + 1
+            return buf[start:i+1]
+
+    if end - start == line_length:
+        start = end # no newline in a full buffer, discard it
+        discarded += 1
+
+    if start:
+        count = end - start
+        spare[:count] = buf[start:end]
+        state[0], state[1] = spare, buf
+        state[2], state[3] = 0, count
+    state[4] = state[3]
+    return None
 
 def non_blocking_readline(uart):
-    if not uart in buffers:
-        buffers[uart] = bytearray()
-
-    line_buffer = buffers[uart]
-
-    line = uart.readline()  # Attempt to read a line (non-blocking)
-    if line:
-        line_buffer.extend(line)
-        if line.endswith(b'\n'):  # Check if the line is complete
-            complete_line = line_buffer
-            buffers[uart] = bytearray()  # Clear the buffer for the next line
-            return complete_line.decode()
-    return None  # Return None if no complete line was available
+    state = uart_buffer(uart)
+    while True:
+        line = next_line(state)
+        if line:
+            return line
+        count = uart.readinto(state[0][state[3]:])  # Attempt to read (non-blocking)
+        if not count:
+            return None  # Return None if no complete line was available
+        state[3] += count
+
+# host stand-in for asyncio.StreamReader over a uart, which cpython
+# cannot wait on, so poll it every few milliseconds instead
+class PollingStream:
+    def __init__(self, uart, interval=.002):
+        self.uart = uart
+        self.interval = interval
+
+    async def readinto(self, buf):
+        while True:
+            count = self.uart.readinto(buf)
+            if count:
+                return count
+            await asyncio.sleep(self.interval)
+
+streams = {}
+def uart_stream(uart):
+    if not uart in streams:
+        if sys.implementation.name == 'micropython':
+            streams[uart] = asyncio.StreamReader(uart)
+        else:
+            streams[uart] = PollingStream(uart)
+    return streams[uart]
+
+# wait for a complete line, the task wakes as soon as the uart has data
+async def readline(uart):
+    state = uart_buffer(uart)
+    stream = uart_stream(uart)
+    while True:
+        line = next_line(state)
+        if line:
+            return line
+        count = await stream.readinto(state[0][state[3]:])
+        if count:
+            state[3] += count
@@ -0,0 +1,139 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+import asyncio
+
+# what to do when a client's queue is full
+DROP_OLDEST = 0
+DROP_NEWEST = 1
+
+# bounded ring of messages for one network client.  Ingest only calls put,
+# which never waits, and the client's own task drains the queue, so a slow
+# client delays nobody but itself.  A client that keeps dropping messages
+# without sending any is marked closed so its task can disconnect it,
+# evict_drops of 0 never closes the queue.
+#
+# Messages are sent in batches, as each frame or segment over wifi costs far
+# more than the few bytes of a sentence.  The sender lingers after the first
+# message until batch messages are waiting, one is queued urgent, or the
+# flush interval passes, then takes everything up to a size limit at once.
+class SendQueue:
+    def __init__(self, size=64, policy=DROP_OLDEST, evict_drops=256, batch=16):
+        self.items = [None]*size
+        self.head = 0
+        self.count = 0
+        self.policy = policy
+        self.evict_drops = evict_drops
+        self.batch = min(batch, size)
+        self.urgent = False
+        self.event = asyncio.Event()
+        self.closed = False
+        self.on_close = None # called once on close, eg to abort a blocked write
+        self.sent = 0
+        self.frames = 0
+        self.dropped = 0
+        self.stalled = 0 # messages dropped since the last send
+
+    def put(self, item, urgent=False):
+        if self.closed:
+            return False
+        size = len(self.items)
+        if self.count == size:
+            self.dropped += 1
+            self.stalled += 1
+            if self.evict_drops and self.stalled >= self.evict_drops:
+                self.close()
+            if self.policy == DROP_NEWEST:
+                return False
+            self.items[self.head] = None
+            self.head = (self.head + 1) % size
+            self.count -= 1
+
+        self.items[(self.head + self.count) % size] = item
+        self.count += 1
+        if urgent:
+            self.urgent = True
+        # wake the sender for the first message, then only to flush early
+        if self.count == 1 or urgent or self.count >= self.batch:
+            self.event.set()
+        return True
+
+    def get(self):
+        item = self.items[self.head]
+        self.items[self.head] = None
+        self.head = (self.head + 1) % len(self.items)
+        self.count -= 1
+        return item
+
+    # messages from the head up to limit total length, at least one
+    def take(self, limit):
+        items = [self.get()]
+        length = len(items[0])
+        while self.count and length + len(self.items[self.head]) <= limit:
+            item = self.get()
+            length += len(item)
+            items.append(item)
+        if not self.count:
+            self.urgent = False
+        return items
+
+    def done(self, count=1):
+        self.sent += count
+        self.frames += 1
+        self.stalled = 0
+
+    def close(self):
+        self.closed = True
+        self.event.set()
+        on_close, self.on_close = self.on_close, None
+        if on_close:
+            on_close()
+
+    # wait until there is something to send, false once closed
+    async def wait(self):
+        while not self.count and not self.closed:
+            self.event.clear()
+            await self.event.wait()
+        return not self.closed
+
+    # after wait, give a batch up to ms to fill unless already due
+    async def linger(self, ms):
+        if self.urgent or self.closed or self.count >= self.batch:
+            return
+        self.event.clear()
+        try:
+            await asyncio.wait_for(self.event.wait(), ms/1000)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self):
+        return {'queued': self.count, 'sent': self.sent, 'frames': self.frames,
+                'dropped': self.dropped}
+
+# frames per second for a steady stream of sentences, unbatched and batched,
+# at about the rate of a busy harbour.  Runs under cpython or micropython.
+def benchmark(rate=100, seconds=3, flush=100, urgent_every=50):
+    line = '!AIVDM,1,1,,A,13u?etPv2;0n:dDPwUM1U1Cb069D,0*23\r\n'
+    async def run(batch):
+        queue = SendQueue(64, batch=batch)
+        async def sender():
+            while await queue.wait():
+                await queue.linger(flush)
+                queue.done(len(queue.take(1024)))
+        task = asyncio.create_task(sender())
+        for i in range(rate*seconds):
+            queue.put(line, i % urgent_every == 0)
+            await asyncio.sleep(1/rate)
+        queue.close()
+        await task
+        print('batch', batch, 'flush', flush, 'ms', 'lines/s', queue.sent/seconds,
+              'frames/s', queue.frames/seconds)
+    asyncio.run(run(1))
+    asyncio.run(run(16))
+
+if __name__ == '__main__':
+    benchmark()
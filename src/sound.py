@@ -3,13 +3,16 @@
 # This Program is free software; you can redistribute it and/or
 # modify it under the terms of the GNU General Public
 # License as published by the Free Software Foundation; either
-# version 3 of the License, or (at your option) any later version.  
+# version 3 of the License, or (at your option) any later version.
+
+import asyncio
+import tones
 
 # play a sound out gpio pin speaker for alarms
 audio = None
 decoder = None
 
-muted=True
+# muting is config['mute'], checked by alarm before anything is played
 
 # try to load audio core
 try:
@@ -24,33 +27,119 @@ except Exception as e:
     print('failed to initialize audio', e)
     #mono 22khz 16bit, or mp3 mono 16khz 32kbit
 
-def play_sound(filename):
+# alarm tones are synthesized at boot, an mp3 named after the alarm
+# (eg proximity.mp3) overrides the tone if it is on flash
+overrides = {}
+if audio:
+    try:
+        import os
+        from audiocore import RawSample
+        tones.init(RawSample)
+        for name in tones.patterns:
+            try:
+                os.stat(name + '.mp3')
+                overrides[name] = name + '.mp3'
+            except OSError:
+                pass
+    except Exception as e:
+        print('failed to initialize tones', e)
+
+# files and wave decoders stay open between plays
+files = {}
+waves = {}
+
+def open_sound(filename):
+    if not filename in files:
+        files[filename] = open(filename, 'rb')
+    f = files[filename]
+    f.seek(0)
+    return f
+
+def start(filename):
+    print('playing', filename)
+    if filename in tones.samples:
+        audio.play(tones.samples[filename], loop=True)
+    elif filename.endswith('.mp3'):
+        decoder.file = open_sound(filename)
+        audio.play(decoder)
+    else:
+        if not filename in waves:
+            waves[filename] = WaveFile(open_sound(filename))
+        audio.play(waves[filename])
+
+# playback requests are queued for the player task so the event loop keeps
+# running while the speaker sounds.  Only the highest priority waiting
+# request is kept, and it interrupts a lower priority sound already playing.
+pending = None # (priority, filename)
+playing = -1   # priority of the sound playing
+wake = asyncio.Event()
+
+def play(filename, priority=0):
+    global pending
     if not audio:
         return
+    if pending and pending[0] >= priority:
+        return # an equal or more important sound is already waiting
+    pending = priority, filename
+    wake.set()
 
-    with open(filename, 'rb') as wave_file:
-        wave = WaveFile(wave_file)
-        audio.play(wave)
-        while audio.playing:
-            pass
+# when muted, drop any waiting request and cut short the sound playing
+def stop():
+    global pending
+    pending = None
+    if audio and audio.playing:
+        audio.stop()
 
-def play_mp3(filename):
-    if muted:
-        print('muted, not playing', filename)
-        return
+def play_sound(filename, priority=0):
+    play(filename, priority)
 
+def play_mp3(filename, priority=0):
     if not decoder:
         return
+    play(filename, priority)
 
-    print('opening', filename)
-    decoder.file = open(filename, 'rb')
-    print('playing', filename)
-    audio.play(decoder)
-    while audio.playing:
-        pass
-    print('done playing', filename)
+def play_alarm(name, priority=0):
+    if name in overrides:
+        play_mp3(overrides[name], priority)
+    elif name in tones.samples:
+        play(name, priority)
 
+poll_period = 50 # ms
+tone_duration = 4000 # ms a looping alarm tone sounds
+async def player():
+    global pending, playing
+    while True:
+        if not pending:
+            wake.clear()
+            await wake.wait()
+            continue
+
+        playing, filename = pending
+        pending = None
+        try:
+            start(filename)
+        except Exception as e:
+            print('failed to play', filename, e)
+            playing = -1
+            continue
+
+        elapsed = 0
+        while audio.playing:
+            if pending and pending[0] > playing:
+                audio.stop() # preempted by a more important sound
+                break
+            if filename in tones.samples and elapsed >= tone_duration:
+                audio.stop()
+                break
+            await asyncio.sleep_ms(poll_period)
+            elapsed += poll_period
+        print('done playing', filename)
+        playing = -1
 
 # for testing
 if __name__ == '__main__':
-    play_mp3('slow.mp3')
+    play_alarm('cpa')
+    async def test():
+        asyncio.create_task(player())
+        await asyncio.sleep(10)
+    asyncio.run(test())
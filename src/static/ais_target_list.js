@@ -14,12 +14,17 @@ function connect_websocket() {
     console.log('try to connect')
     socket = new WebSocket('ws://' + location.host + '/ws');
 
+    // each frame holds one or more sentences
     socket.addEventListener('message', ev => {
-        let line = ev.data;
-        if(line.substring(3, 6) == 'VDM')
-            ais_message(line);
-        else
-            gps_message(line);
+        for(let line of ev.data.split('\n')) {
+            line = line.trim();
+            if(!line)
+                continue;
+            if(line.substring(3, 6) == 'VDM')
+                ais_message(line);
+            else
+                gps_message(line);
+        }
     });
 
     socket.addEventListener('close', ev => {
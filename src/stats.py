@@ -0,0 +1,110 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# runtime statistics served by web.py at /stats and /ws/stats.  The ingest
+# tasks only increment counters and histogram buckets; everything else is
+# gathered from the modules that already keep counts, through the sources
+# registered by ais_monitor, once per report.
+import time, gc
+
+# also imported on a host through nmea, by the log tools
+def ticks_ms():
+    try:
+        return time.ticks_ms()
+    except:
+        return int(time.time()*1000)
+
+start_time = ticks_ms()
+
+# totals since boot, reported along with the rate per second between reports
+counters = {'ais': 0, # messages decoded
+            'ais_failed': 0, # sentences raising an exception
+            'gps': 0, # fixes
+            'gps_failed': 0,
+            'checksum_failed': 0, # any sentence
+            'deferred': 0, # ingest yielded to other tasks mid burst
+            'dropped': 0, # sentences not forwarded to clients
+            'overruns': 0} # uart receive buffer was full
+
+# loop time histograms, counts of times under each bound in ms, then the
+# count over the last bound and the longest time seen
+loop_bounds = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+loops = {}
+
+def histogram(name):
+    if not name in loops:
+        loops[name] = [0]*(len(loop_bounds) + 2)
+    return loops[name]
+
+def record(h, ms):
+    i = 0
+    for bound in loop_bounds:
+        if ms < bound:
+            break
+        i += 1
+    h[i] += 1
+    if ms > h[-1]:
+        h[-1] = ms
+
+# garbage is collected from housekeeping once gc_step bytes were allocated,
+# which keeps each pause short and out of ingest and is the only way to time
+# it.  A fall in allocation between checks is an automatic collection.
+gc_step = 16*1024
+gc_stats = {'collections': 0, 'automatic': 0, 'pause_ms': 0, 'longest_ms': 0}
+gc_base = 0 # allocated after the last collection
+gc_last = 0 # allocated at the last check
+
+def collect():
+    global gc_base, gc_last
+    a = gc.mem_alloc()
+    if a < gc_last:
+        gc_stats['automatic'] += 1
+        gc_base = a
+    if a - gc_base >= gc_step:
+        t0 = time.ticks_us()
+        gc.collect()
+        pause = time.ticks_diff(time.ticks_us(), t0) / 1000
+        gc_stats['collections'] += 1
+        gc_stats['pause_ms'] += pause
+        if pause > gc_stats['longest_ms']:
+            gc_stats['longest_ms'] = pause
+        a = gc_base = gc.mem_alloc()
+    gc_last = a
+
+# name to a function returning figures of another module for the report
+sources = {}
+
+def source(name, function):
+    sources[name] = function
+
+report = None # the latest, replaced as a whole so readers never see it change
+last_time = start_time
+last_counts = dict(counters)
+
+# called periodically, extra holds figures the caller already has at hand
+def update(extra={}):
+    global report, last_time, last_counts
+    t = ticks_ms()
+    seconds = (t - last_time) / 1000
+    counts = dict(counters)
+    rates = {}
+    for name, count in counts.items():
+        rates[name] = (count - last_counts[name]) / seconds if seconds else 0
+    last_time, last_counts = t, counts
+
+    r = {'uptime': (t - start_time) // 1000, 'counts': counts, 'rates': rates,
+         'loop_bounds_ms': loop_bounds,
+         'loops_ms': {name: list(h) for name, h in loops.items()},
+         'gc': dict(gc_stats), 'mem_free': gc.mem_free(), 'mem_alloc': gc.mem_alloc()}
+    r.update(extra)
+    for name, function in sources.items():
+        try:
+            r[name] = function()
+        except Exception as e:
+            r[name] = str(e)
+    report = r
+    return r
@@ -0,0 +1,114 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# table of ais targets, one slot per mmsi stored in fixed size arrays so
+# memory use does not grow with the number of ships in range
+import math
+from array import array
+
+capacity = 384 # a busy harbour has over 300 ships in range
+max_age = 600000 # ms, remove targets not heard from in 10 minutes
+NA = -1.0 # not available, sog, cog, dist and cpa are never negative
+
+def column(typecode):
+    return array(typecode, [0]*capacity)
+
+mmsi = column('i')
+lat = column('f')
+lon = column('f')
+sog = column('f')
+cog = column('f')
+vx = column('f') # knots east, from sog and cog
+vy = column('f') # knots north
+seen = column('i') # ticks_ms of last report
+dist = column('f') # nautical miles
+cpa = column('f')  # nautical miles
+tcpa = column('f') # seconds
+
+index = {} # mmsi to slot
+free = list(range(capacity-1, -1, -1))
+stats = {'evicted': 0, 'expired': 0, 'ignored': 0}
+
+def remove(slot):
+    del index[mmsi[slot]]
+    mmsi[slot] = 0 # marks the slot empty for sweeps
+    free.append(slot)
+
+# when the table is full the farthest target makes room, so the ships that
+# matter for alarms are kept.  An unknown distance counts as farthest, and
+# the least recently seen goes first among equals.  Nothing is evicted and
+# false is returned if the new target at distance d is farther still.
+def evict_farthest(d):
+    farthest, far = None, 0
+    for slot in index.values():
+        s = dist[slot]
+        if s == NA:
+            s = 1e9
+        if farthest is None or s > far or (s == far and seen[slot] < seen[farthest]):
+            farthest, far = slot, s
+    if d != NA and d >= far:
+        return False
+    remove(farthest)
+    stats['evicted'] += 1
+    return True
+
+def value(ais_data, name):
+    v = ais_data.get(name)
+    return NA if v is None else v
+
+# store a decoded position report, after alarm.compute added dist and cpa
+def update(ais_data, t):
+    if not 'lat' in ais_data:
+        return None # not a position report
+
+    m = ais_data['mmsi']
+    slot = index.get(m)
+    if slot is None:
+        if not free and not evict_farthest(value(ais_data, 'dist')):
+            stats['ignored'] += 1
+            return None
+        slot = free.pop()
+        index[m] = slot
+        mmsi[slot] = m
+
+    lat[slot] = ais_data['lat']
+    lon[slot] = ais_data['lon']
+    s, c = value(ais_data, 'sog'), value(ais_data, 'cog')
+    sog[slot], cog[slot] = s, c
+    if s == NA or c == NA:
+        vx[slot] = vy[slot] = 0
+    else:
+        c = math.radians(c)
+        vx[slot], vy[slot] = s*math.sin(c), s*math.cos(c)
+    seen[slot] = t
+    dist[slot] = value(ais_data, 'dist')
+    cpa[slot] = value(ais_data, 'cpa')
+    tcpa[slot] = ais_data.get('tcpa', 0)
+    return slot
+
+def expire(t):
+    for slot in list(index.values()):
+        if t - seen[slot] > max_age:
+            remove(slot)
+            stats['expired'] += 1
+
+# the k nearest targets within maxdist as a sorted list of (dist, slot)
+def nearest(k, maxdist=10):
+    result = []
+    for slot in index.values():
+        d = dist[slot]
+        if d < 0 or d >= maxdist:
+            continue
+        if len(result) == k:
+            if d >= result[-1][0]:
+                continue
+            result.pop()
+        i = len(result)
+        while i and result[i-1][0] > d:
+            i -= 1
+        result.insert(i, (d, slot))
+    return result
@@ -0,0 +1,42 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# alarm tones synthesized into ram at boot, each buffer holds one cycle of
+# the pattern which is looped by the audio output, so sounding an alarm
+# reads nothing from flash and allocates nothing
+from array import array
+
+sample_rate = 8000
+volume = 100 # square wave amplitude around the 128 midpoint
+
+# (frequency in hz, duration in ms), 0 hz is silence
+patterns = {'proximity': ((880, 150), (0, 250)),
+            'cpa': ((1760, 80), (0, 40), (1760, 80), (0, 40), (1760, 80), (0, 80)),
+            'gps': ((440, 200), (660, 200))}
+
+def synthesize(pattern):
+    count = 0
+    for freq, ms in pattern:
+        count += sample_rate*ms//1000
+    buf = array('B', [128]*count) # unsigned 8 bit samples
+
+    i = 0
+    for freq, ms in pattern:
+        n = sample_rate*ms//1000
+        if freq:
+            half = sample_rate//(2*freq) # samples per half period
+            for j in range(n):
+                buf[i+j] = 128+volume if (j//half) & 1 == 0 else 128-volume
+        i += n
+    return buf
+
+buffers = {}
+samples = {}
+def init(RawSample):
+    for name, pattern in patterns.items():
+        buffers[name] = synthesize(pattern)
+        samples[name] = RawSample(buffers[name], sample_rate=sample_rate)
@@ -0,0 +1,369 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# log of every gps fix and ais position report for reviewing an incident.
+# Each report is a fixed width binary record, gathered in ram and written a
+# whole flash block at a time into a ring of files, so the flash is written
+# rarely and the log never grows beyond the space it was given.
+import os, struct, asyncio
+
+# record: kind, message type, ms since the previous record, lat and lon in
+# 1/10000 minute (the ais resolution), sog and cog in tenths, and mmsi
+record_format = '<BBHiiHHI'
+record_size = 20
+block_size = 4096 # one flash erase block
+block_records = block_size // record_size # the rest of a block is zero
+
+# each block starts with a sync record so it can be read on its own.  Its
+# mmsi is the absolute ticks_ms, lat and lon the utc date (ddmmyy) and ms of
+# the day of the last gps fix, sog the age of that fix in tenths of a
+# second and cog the sequence number of the file.
+KIND_SYNC = 83 # S
+KIND_GPS = 71  # G
+KIND_AIS = 65  # A
+NA = 0xffff # sog or cog not available
+ll_scale = 600000
+
+log_dir = 'log'
+file_count = 4
+file_blocks = 0 # blocks in each file, set from free space by start
+log_share = 2 # use at most 1/log_share of the free space
+reserve = 65536 # bytes, logging pauses when less is free
+
+enabled = False
+paused = False
+block = bytearray(block_size) # being filled
+spare = bytearray(block_size)
+full = None # waiting to be written
+fill = 0 # records in block
+last_t = 0
+utc = None # date, ms of day and ticks_ms of the last gps fix
+wake = asyncio.Event()
+
+file = None
+file_index = -1
+file_seq = 0
+file_written = 0 # blocks
+stats = {'records': 0, 'blocks': 0, 'dropped': 0, 'files': 0}
+
+def filename(i):
+    return '%s/track%d.bin' % (log_dir, i)
+
+# sequence number of a log file, None if it has no valid block
+def file_sequence(name):
+    try:
+        with open(name, 'rb') as f:
+            data = f.read(record_size)
+    except OSError:
+        return None
+    if len(data) < record_size or data[0] != KIND_SYNC:
+        return None
+    return struct.unpack_from(record_format, data)[6]
+
+# size the ring from free space reported by os.statvfs, and continue after
+# the newest file already on flash.  The files of an earlier ring count as
+# free, as they are overwritten, so the ring is the same size every boot.
+def start(statvfs):
+    global enabled, file_blocks, file_index, file_seq
+    free = statvfs[0]*statvfs[3]
+    for i in range(file_count):
+        try:
+            free += os.stat(filename(i))[6]
+        except OSError:
+            pass # not written yet
+    file_blocks = (free - reserve) // log_share // (file_count*block_size)
+    if file_blocks < 1:
+        print('not enough free space for the track log', free)
+        return False
+    try:
+        os.mkdir(log_dir)
+    except OSError:
+        pass # already exists
+
+    for i in range(file_count):
+        seq = file_sequence(filename(i))
+        if seq is not None and seq >= file_seq:
+            file_index, file_seq = i, seq
+    enabled = True
+    print('track log', file_count, 'files of', file_blocks, 'blocks')
+    return True
+
+# pause logging while free space is below the reserve, called with the
+# statvfs already taken for the statistics report
+def check_space(statvfs):
+    global paused
+    free = statvfs[0]*statvfs[3]
+    if not paused and free < reserve:
+        print('track log paused, free space', free)
+        paused = True
+    elif paused and free > 2*reserve:
+        paused = False
+
+def submit():
+    global block, spare, full, fill
+    if fill < block_records: # zero the rest, marking the end of the records
+        block[fill*record_size:] = bytes(block_size - fill*record_size)
+    full, block, spare = block, spare, block
+    fill = 0
+    wake.set()
+
+def sync(t):
+    global fill
+    date, ms, age = 0, 0, 0
+    if utc:
+        age = (t - utc[2]) // 100
+        if 0 <= age < NA:
+            date, ms = utc[0], utc[1]
+        else:
+            age = 0 # too old to tell the time from
+    struct.pack_into(record_format, block, 0, KIND_SYNC, 0, 0, date, ms, age, 0,
+                     t & 0xffffffff)
+    fill = 1
+
+def add(kind, message_type, t, lat, lon, sog, cog, mmsi):
+    global fill, last_t
+    if not enabled or paused:
+        return
+    if fill == block_records: # writer has not caught up
+        stats['dropped'] += 1
+        return
+    dt = t - last_t
+    if not fill or dt < 0 or dt > 65535:
+        if fill: # time can only be restarted by a new block
+            if full is not None:
+                stats['dropped'] += 1
+                return
+            submit()
+        sync(t)
+        dt = 0
+    sog = NA if sog is None else int(sog*10 + .5)
+    cog = NA if cog is None else int(cog*10 + .5)
+    struct.pack_into(record_format, block, fill*record_size, kind, message_type, dt,
+                     round(lat*ll_scale), round(lon*ll_scale), sog, cog, mmsi)
+    fill += 1
+    last_t = t
+    stats['records'] += 1
+    if fill == block_records:
+        if full is None:
+            submit()
+
+def gps(gps_data, t):
+    global utc
+    if 'date' in gps_data:
+        utc = gps_data['date'], gps_data['time'], t
+    add(KIND_GPS, 0, t, gps_data['lat'], gps_data['lon'],
+        gps_data['sog'], gps_data.get('cog'), 0)
+
+def ais(ais_data, t):
+    if 'lat' in ais_data:
+        add(KIND_AIS, ais_data['message_type'], t, ais_data['lat'], ais_data['lon'],
+            ais_data.get('sog'), ais_data.get('cog'), ais_data['mmsi'])
+
+def next_file():
+    global file, file_index, file_seq, file_written
+    if file:
+        file.close()
+    file_index = (file_index + 1) % file_count
+    file_seq = (file_seq + 1) & 0xffff
+    file = open(filename(file_index), 'wb')
+    file_written = 0
+    stats['files'] += 1
+
+def write(data):
+    global file_written
+    if not file or file_written == file_blocks:
+        next_file()
+    struct.pack_into('<H', data, 14, file_seq) # cog of the sync record
+    file.write(data)
+    file.flush()
+    file_written += 1
+    stats['blocks'] += 1
+
+# full blocks are written from this task, a block write takes some
+# milliseconds, so ingest only ever copies a record into ram
+async def writer():
+    global full
+    while True:
+        if full is None:
+            wake.clear()
+            await wake.wait()
+            continue
+        try:
+            write(full)
+        except OSError as e:
+            print('track log write failed', e)
+            stats['dropped'] += block_records
+        full = None
+        if fill == block_records: # filled while the last one was written
+            submit()
+
+# write out a block waiting for the writer and the partly filled one,
+# called before every machine.reset so the last records before it are kept
+def flush():
+    global fill, full
+    if not enabled:
+        return
+    try:
+        if full is not None:
+            write(full)
+            full = None
+        if fill > 1:
+            block[fill*record_size:] = bytes(block_size - fill*record_size)
+            write(block)
+            fill = 0
+    except OSError as e:
+        print('track log flush failed', e)
+
+# reading logs back, on the pico or a computer with the files copied off
+
+# days since 1970-01-01 of a proleptic gregorian date, and the reverse
+def days_from_civil(y, m, d):
+    y -= m <= 2
+    era = y // 400
+    yoe = y - era*400
+    doy = (153*(m + (-3 if m > 2 else 9)) + 2)//5 + d - 1
+    doe = yoe*365 + yoe//4 - yoe//100 + doy
+    return era*146097 + doe - 719468
+
+def civil_from_days(z):
+    z += 719468
+    era = z // 146097
+    doe = z - era*146097
+    yoe = (doe - doe//1460 + doe//36524 - doe//146096) // 365
+    doy = doe - (365*yoe + yoe//4 - yoe//100)
+    mp = (5*doy + 2)//153
+    d = doy - (153*mp + 2)//5 + 1
+    m = mp + (3 if mp < 10 else -9)
+    return yoe + era*400 + (m <= 2), m, d
+
+# records of a log file as dicts, t is ticks_ms, utc seconds since 1970 or
+# None when no gps time was known
+def read(name):
+    with open(name, 'rb') as f:
+        while True:
+            data = f.read(block_size)
+            if len(data) < record_size:
+                return
+            base = None # utc ms at ticks t0
+            for i in range(len(data) // record_size):
+                kind, mtype, dt, lat, lon, sog, cog, mmsi = \
+                    struct.unpack_from(record_format, data, i*record_size)
+                if kind == KIND_SYNC:
+                    t = mmsi # ticks are kept to 32 bits
+                    base = None
+                    if lat:
+                        y = 2000 + lat % 100
+                        days = days_from_civil(y, lat // 100 % 100, lat // 10000)
+                        base = days*86400000 + lon + sog*100, t
+                    continue
+                if kind != KIND_GPS and kind != KIND_AIS:
+                    break # end of a partly filled block
+                t += dt
+                r = {'kind': 'gps' if kind == KIND_GPS else 'ais', 't': t,
+                     'utc': (base[0] + t - base[1]) / 1000 if base else None,
+                     'lat': lat / ll_scale, 'lon': lon / ll_scale,
+                     'sog': None if sog == NA else sog / 10,
+                     'cog': None if cog == NA else cog / 10}
+                if kind == KIND_AIS:
+                    r['message_type'], r['mmsi'] = mtype, mmsi
+                yield r
+
+# log files oldest first
+def log_files(directory=log_dir):
+    files = []
+    for name in os.listdir(directory):
+        if name.startswith('track') and name.endswith('.bin'):
+            name = directory + '/' + name
+            seq = file_sequence(name)
+            if seq is not None:
+                files.append((seq, name))
+    files.sort()
+    return [name for seq, name in files]
+
+def utc_fields(utc):
+    if utc is None:
+        return '', ''
+    days, ms = divmod(int(utc*1000), 86400000)
+    y, m, d = civil_from_days(days)
+    s = ms // 1000
+    hms = '%02d%02d%02d.%02d' % (s // 3600, s // 60 % 60, s % 60, ms % 1000 // 10)
+    return hms, '%02d%02d%02d' % (d, m, y % 100)
+
+def nmea_sentence(body, start='$'):
+    cksum = 0
+    for c in body:
+        cksum ^= ord(c)
+    return '%s%s*%02X' % (start, body, cksum)
+
+# 6 bit armored payload of (value, bits) fields
+def ais_payload(fields):
+    v = count = 0
+    for value, bits in fields:
+        v = v << bits | value & ((1 << bits) - 1)
+        count += bits
+    pad = -count % 6
+    v <<= pad
+    payload = ''
+    for i in range(count + pad - 6, -1, -6):
+        c = v >> i & 63
+        payload += chr(c + 48 if c < 40 else c + 56)
+    return payload, pad
+
+def nmea_record(r):
+    if r['kind'] == 'gps':
+        hms, dmy = utc_fields(r['utc'])
+        def dm(value, width, hemispheres):
+            a = abs(value)
+            return '%0*d%07.4f,%s' % (width, int(a), (a - int(a))*60,
+                                      hemispheres[1 if value < 0 else 0])
+        sog = r['sog'] or 0
+        cog = '' if r['cog'] is None else '%.1f' % r['cog']
+        return nmea_sentence('GPRMC,%s,A,%s,%s,%.1f,%s,%s,,' % (
+            hms, dm(r['lat'], 2, 'NS'), dm(r['lon'], 3, 'EW'), sog, cog, dmy))
+
+    sog = 1023 if r['sog'] is None else int(r['sog']*10 + .5)
+    cog = 3600 if r['cog'] is None else int(r['cog']*10 + .5)
+    lat, lon = int(round(r['lat']*ll_scale)), int(round(r['lon']*ll_scale))
+    if r['message_type'] in (1, 2, 3): # class A position report
+        fields = ((r['message_type'], 6), (0, 2), (r['mmsi'], 30), (15, 4), (-128, 8),
+                  (sog, 10), (0, 1), (lon, 28), (lat, 27), (cog, 12), (511, 9),
+                  (60, 6), (0, 2), (0, 3), (0, 1), (0, 19))
+    else: # class B, type 19 is written as the shorter type 18
+        fields = ((18, 6), (0, 2), (r['mmsi'], 30), (0, 8), (sog, 10), (0, 1),
+                  (lon, 28), (lat, 27), (cog, 12), (511, 9), (60, 6), (0, 2),
+                  (1, 1), (0, 6), (0, 20))
+    payload, pad = ais_payload(fields)
+    return nmea_sentence('AIVDM,1,1,,A,%s,%d' % (payload, pad), '!')
+
+csv_header = 'utc,ticks_ms,kind,message_type,mmsi,lat,lon,sog,cog'
+def csv_record(r):
+    def f(v):
+        return '' if v is None else str(v)
+    utc = r['utc']
+    if utc is not None:
+        hms, dmy = utc_fields(utc)
+        utc = '20%s-%s-%sT%s:%s:%sZ' % (dmy[4:], dmy[2:4], dmy[:2],
+                                        hms[:2], hms[2:4], hms[4:])
+    return ','.join(map(f, (utc, r['t'], r['kind'], r.get('message_type'),
+                            r.get('mmsi'), r['lat'], r['lon'], r['sog'], r['cog'])))
+
+# print every record of the given files, oldest first by default
+#   python3 tracklog.py [nmea|csv] [log directory or files...]
+def export(names, fmt='csv', out=print):
+    if fmt == 'csv':
+        out(csv_header)
+    for name in names:
+        for r in read(name):
+            out(nmea_record(r) if fmt == 'nmea' else csv_record(r))
+
+if __name__ == '__main__':
+    import sys
+    fmt = sys.argv[1] if len(sys.argv) > 1 else 'csv'
+    names = sys.argv[2:] or [log_dir]
+    if len(names) == 1 and not names[0].endswith('.bin'):
+        names = log_files(names[0])
+    export(names, fmt)
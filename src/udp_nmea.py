@@ -0,0 +1,118 @@
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# send nmea sentences as udp broadcast or multicast datagrams, so any number
+# of chart plotters can listen for the cost of one send.  Sentences are
+# batched like the tcp clients, several to a datagram.
+import socket
+import asyncio
+import sendqueue
+
+udp_port = 10110
+multicast_group = '239.192.0.1' # organization local scope
+udp_batch = 16
+udp_flush_period = 100 # ms
+udp_datagram_size = 1024 # stays within one wifi frame
+
+sock = None
+address = None
+queue = None
+errors = 0
+
+# mode is 'broadcast' or 'multicast', host overrides the destination
+def start(mode, port=udp_port, host=None):
+    global sock, address, queue
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if mode == 'broadcast':
+        try:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        except (AttributeError, OSError):
+            pass # lwip sends broadcasts without it
+        if not host:
+            host = '255.255.255.255'
+    elif mode == 'multicast':
+        if not host:
+            host = multicast_group
+    else:
+        print('unknown udp mode', mode)
+        s.close()
+        return False
+    address = socket.getaddrinfo(host, port)[0][-1]
+    sock = s
+    queue = sendqueue.SendQueue(64, sendqueue.DROP_OLDEST, 0, udp_batch)
+    print('nmea udp', mode, host, port)
+    return True
+
+# called from ingest with a copy of the line
+def write(line, urgent=False):
+    if queue:
+        queue.put(line, urgent)
+
+async def sender():
+    global errors
+    while await queue.wait():
+        await queue.linger(udp_flush_period)
+        lines = queue.take(udp_datagram_size)
+        try:
+            sock.sendto(b''.join(lines), address)
+        except OSError as e:
+            errors += 1 # no network yet, the batch is lost
+        queue.done(len(lines))
+
+def stats():
+    if not queue:
+        return None
+    s = queue.stats()
+    s['errors'] = errors
+    return s
+
+# for testing on linux, send sentences over loopback to a listening socket
+#   python3 udp_nmea.py [broadcast|multicast] [count]
+if __name__ == '__main__':
+    import sys, struct
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'broadcast'
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    port = udp_port + 1 # leave the real port to real listeners
+
+    r = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    r.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    r.bind(('', port))
+    r.setblocking(False)
+    if mode == 'multicast':
+        mreq = struct.pack('4s4s', socket.inet_aton(multicast_group),
+                           socket.inet_aton('0.0.0.0'))
+        r.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+
+    # sentences and datagrams waiting on the listening socket
+    def receive():
+        sentences = datagrams = 0
+        try:
+            while True:
+                sentences += r.recv(2048).count(b'\n')
+                datagrams += 1
+        except OSError: # nothing more to read
+            pass
+        return sentences, datagrams
+
+    line = b'!AIVDM,1,1,,A,13u?etPv2;0n:dDPwUM1U1Cb069D,0*23\r\n'
+    async def test():
+        if not start(mode, port):
+            return
+        task = asyncio.create_task(sender())
+        received = datagrams = 0
+        for i in range(count):
+            write(line, i % 100 == 0)
+            await asyncio.sleep(.001)
+            s, d = receive()
+            received, datagrams = received + s, datagrams + d
+        await asyncio.sleep(2*udp_flush_period/1000)
+        s, d = receive()
+        received, datagrams = received + s, datagrams + d
+        queue.close()
+        await task
+        print('sent', count, 'received', received, 'in', datagrams, 'datagrams', stats())
+    asyncio.run(test())
@@ -6,44 +6,210 @@
 # version 3 of the License, or (at your option) any later version.  
 
 
-import asyncio
+import asyncio, json, os
 from microdot import Microdot, Response, send_file
 from microdot.websocket import with_websocket
 from microdot.utemplate import Template
 
 import wireless
+import sound
 import config
+import decode_ais
+import sendqueue
+import backlog
+import targets
+import stats
+import latency
+import tracklog
+
+# forward static and voyage data (names, call signs) for the browser to decode
+decode_ais.decode_level([5, 24], decode_ais.DECODE_HEADER)
 
 app = Microdot()
 
-rotations = 3 # messages will timeout after 3 rotations
-nmea_messages = list(map(lambda x : {}, range(rotations)))
 last_gps_nmea = None
-current5 = rotations
 
 Response.default_content_type = 'text/html'
 
-websockets = []
+# each websocket has its own bounded send queue drained by its own task
+# sentences are sent several to a frame, the browser splits them on newlines
+ws_queue_size = 64
+ws_policy = sendqueue.DROP_OLDEST
+ws_evict_drops = 256 # disconnect a client that drops this many in a row
+ws_batch = 16 # sentences that flush a frame early
+ws_flush_period = 100 # ms, longest a sentence waits for others
+ws_frame_size = 1024 # most characters in one frame
+ws_queues = []
+clients = {'targets': 0, 'stats': 0} # websockets of the other channels
+
+async def websocket_sender(ws, queue):
+    try:
+        while await queue.wait():
+            await queue.linger(ws_flush_period)
+            nmeas = queue.take(ws_frame_size)
+            await ws.send(''.join(nmeas))
+            queue.done(len(nmeas))
+            if latency.ws_line is not None:
+                latency.sent_ws(nmeas)
+    except Exception as e:
+        print('except sending to websocket', e, ws)
+    queue.close()
+    try:
+        await ws.close()
+    except Exception:
+        pass
 
 @app.route('/ws')
 @with_websocket
 async def websocket(request, ws):
     print('got new websocket', ws, request)
-    websockets.append(ws)
-    # send backlog of recent unique nmea messages to new connections
-    if last_gps_nmea:
-        ws.send(last_gps_nmea)
-    for nmeas in nmea_messages:
-        for nmea in nmeas:
-            ws.send(nmea)
-    while True:
-        data = await ws.receive()
+    queue = sendqueue.SendQueue(ws_queue_size, ws_policy, ws_evict_drops, ws_batch)
+    # evicting a stalled client closes its socket, ending a blocked send
+    queue.on_close = lambda: wireless.abort(request.sock[1])
+    ws_queues.append(queue)
+    try:
+        # send backlog of recent unique nmea messages to new connections
+        # new messages are queued meanwhile and sent after
+        frame = [last_gps_nmea] if last_gps_nmea else []
+        length = len(frame[0]) if frame else 0
+        for nmeas in backlog.snapshot():
+            for nmea in nmeas:
+                if length + len(nmea) > ws_frame_size and frame:
+                    await ws.send(''.join(frame))
+                    frame, length = [], 0
+                frame.append(nmea)
+                length += len(nmea)
+        if frame:
+            await ws.send(''.join(frame))
+
+        asyncio.create_task(websocket_sender(ws, queue))
+        while not queue.closed:
+            data = await ws.receive()
+    finally:
+        queue.close()
+        ws_queues.remove(queue)
+        print('websocket closed', ws, queue.stats())
+
+# decoded target state for clients that would rather not decode nmea.
+# values are rounded to display precision so noise is not sent as changes
+target_fields = (('lat', targets.lat, 5), ('lon', targets.lon, 5),
+                 ('sog', targets.sog, 1), ('cog', targets.cog, 1),
+                 ('dist', targets.dist, 2), ('cpa', targets.cpa, 2),
+                 ('tcpa', targets.tcpa, 0))
+targets_period = 1000 # ms, most frequent updates sent to a targets client
+
+def target_state(slot):
+    state = []
+    for name, column, digits in target_fields:
+        v = column[slot]
+        state.append(None if v == targets.NA else round(v, digits))
+    if state[5] is None:
+        state[6] = None # no tcpa without cpa
+    return tuple(state)
+
+# fields of each target changed since the states in sent, which is updated
+# to match the table, at most targets_chunk targets at a time so no message
+# holds the whole table.  Every field is included for a target not in sent,
+# and the first chunk also lists the targets removed.
+targets_chunk = 32
+
+def target_deltas(sent):
+    removed = [m for m in sent if not m in targets.index]
+    for m in removed:
+        del sent[m]
+
+    changed = {}
+    for m in list(targets.index): # the table may change between chunks
+        slot = targets.index.get(m)
+        if slot is None:
+            continue # expired since
+        state = target_state(slot)
+        last = sent.get(m)
+        if last == state:
+            continue
+        fields = {}
+        for i in range(len(state)):
+            if last is None or last[i] != state[i]:
+                fields[target_fields[i][0]] = state[i]
+        changed[str(m)] = fields # json keys are strings
+        sent[m] = state
+        if len(changed) == targets_chunk:
+            yield changed, removed
+            changed, removed = {}, []
+    if changed or removed:
+        yield changed, removed
+
+# one json object, written a chunk of targets at a time
+def targets_body():
+    yield '{"targets": {'
+    separator = ''
+    for changed, removed in target_deltas({}):
+        yield separator + json.dumps(changed)[1:-1]
+        separator = ', '
+    yield '}}'
+
+@app.route('/targets')
+async def targets_json(request):
+    return Response(targets_body(), headers={'Content-Type': 'application/json'})
+
+# the full table is sent first, then only changes at most once a period
+@app.route('/ws/targets')
+@with_websocket
+async def websocket_targets(request, ws):
+    print('got new targets websocket', ws, request)
+    sent = {}
+    clients['targets'] += 1
+    try:
+        while True:
+            for changed, removed in target_deltas(sent):
+                await ws.send(json.dumps({'targets': changed, 'removed': removed}))
+            await asyncio.sleep_ms(targets_period)
+    except Exception as e:
+        print('targets websocket closed', ws, e)
+    clients['targets'] -= 1
+
+# runtime statistics, see stats.py.  The websocket is sent each new report
+stats_poll_period = 1000 # ms
+
+@app.route('/stats')
+async def stats_json(request):
+    report = stats.report or stats.update()
+    return Response(json.dumps(report), headers={'Content-Type': 'application/json'})
+
+@app.route('/ws/stats')
+@with_websocket
+async def websocket_stats(request, ws):
+    print('got new stats websocket', ws, request)
+    sent = None
+    clients['stats'] += 1
+    try:
+        while True:
+            report = stats.report or stats.update()
+            if report is not sent:
+                await ws.send(json.dumps(report))
+                sent = report
+            await asyncio.sleep_ms(stats_poll_period)
+    except Exception as e:
+        print('stats websocket closed', ws, e)
+    clients['stats'] -= 1
+
+# the settings page is rendered once and kept until the config changes,
+# whether from this form or the buttons, so loading it costs no rendering
+index_page = None
+index_config = None
+
+def render_index(c):
+    global index_page, index_config
+    snapshot = tuple(c.items())
+    if snapshot != index_config:
+        index_page = Template('index.html').render(config=c)
+        index_config = snapshot
+    return index_page
 
 @app.route('/', methods=['GET', 'POST'])
 async def index(req):
-    name = None
+    c = config.config
     if req.method == 'POST':
-        c = config.config
         needwrite = False
         for name in c:
             value = req.form.get(name)
@@ -51,18 +217,63 @@ async def index(req):
                 c[name] = value
                 if name in ['ssid', 'psk']:
                     wireless.reset()
+                elif name == 'mute' and value:
+                    sound.stop()
                 needwrite = True
         if needwrite:
             config.write()
 
-    return Template('index.html').render(config=c)
+    return render_index(c)
+
+# static files are served gzipped when tools/compress_static.py stored a
+# .gz beside them and the browser accepts it.  Files only change when the
+# flash is rewritten, so browsers may cache them and revalidate by etag.
+static_max_age = 24*3600 # seconds
+static_etags = None # filename to etag of every file under static
+
+def list_static(directory):
+    for name in os.listdir(directory):
+        filename = directory + '/' + name
+        s = os.stat(filename)
+        if s[0] & 0x4000: # directory
+            list_static(filename)
+        else:
+            static_etags[filename] = '"%x-%x"' % (s[6], s[8]) # size and mtime
+
+# the files are listed on the first request, so a request for a file that
+# does not exist costs no stat and adds nothing to the table
+def static_etag(filename):
+    global static_etags
+    if static_etags is None:
+        static_etags = {}
+        try:
+            list_static('static')
+        except OSError as e:
+            print('failed to list static files', e)
+    return static_etags.get(filename)
 
 @app.route('/<path:path>')
 async def static(request, path):
     if '..' in path:
         # directory traversal is not allowed
         return 'Not found', 404
-    return send_file('static/' + path)
+    filename = 'static/' + path
+    ext = ''
+    if 'gzip' in request.headers.get('Accept-Encoding', '') and \
+       static_etag(filename + '.gz'):
+        ext = '.gz'
+    etag = static_etag(filename + ext)
+    if not etag:
+        return 'Not found', 404
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304, {'ETag': etag, 'Vary': 'Accept-Encoding'}
+
+    # the file is streamed from flash in small chunks
+    response = send_file(filename, max_age=static_max_age,
+                         compressed=bool(ext), file_extension=ext)
+    response.headers['ETag'] = etag
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 async def serve():
     try:
@@ -70,35 +281,26 @@ async def serve():
     except Exception as e:
         print("CAUGHT EXCEPTION server!!", e)
         import machine
+        tracklog.flush()
         machine.reset()
 
-async def ais_data(ais_data, nmeas):
-    for nmea in nmeas:
-        for ws in list(websockets):
-            try:
-                await ws.send(nmea)
-            except Exception as e:
-                print('except sending to websocket', e, ws)
-                websockets.remove(ws)
-                
-    # store each unique mmsi and message type
+# called from ingest, only queues messages and never waits on a client
+# urgent messages, from targets raising alarms, are sent without delay
+def ais_data(ais_data, nmeas, urgent=False):
+    nmeas = [nmea.decode() for nmea in nmeas] # websocket text frames
+    if latency.sampling:
+        latency.ws_line = nmeas[-1]
+    for queue in ws_queues:
+        for nmea in nmeas:
+            queue.put(nmea, urgent)
+
+    # keep the most recent of each mmsi and message type for new clients
     key = (ais_data['message_type'], ais_data['mmsi'])
-    for rotation in range(1, rotations):
-        if key in nmea_messages:
-            del nmea_messages[rotation][key] # remove old entree
-    nmea_messages[0][key] = nmeas # store most recent
-
-    # find which 5 minute index we are currently
-    minute5 = ais_data['ticks_ms'] / 1000 / 60 / 5
-    global current5
-    if minute5 > current5:  # if we rolled over?
-        current5 = minute5
-        nmea_messages.pop() # remove stale messages
-        nmea_messages.insert(0, {})
+    backlog.update(key, ais_data['ticks_ms'], nmeas)
 
 def gps_data(nmea):
     global last_gps_nmea
-    last_gps_nmea = gps_data
+    last_gps_nmea = bytes(nmea).decode() # nmea is a view of the uart buffer
 
 # for testing
 def main():
@@ -11,11 +11,15 @@ import machine
 import asyncio
 
 from config import config
+import sendqueue
+import udp_nmea
+import latency
+import tracklog
 
 #Connect to WLAN
 wlan = network.WLAN(network.STA_IF)
 wlan.active(True)
-wlan.connect(ssid, psk)
+wlan.connect(config['ssid'], config['psk'])
 
 # resolve ais_monitor.local to our ip address
 from mdns_client import Client
@@ -30,25 +34,76 @@ responder = Responder(
 
 responder.advertise("_nmea", "_tcp", port=config['nmea_port'])
 
-writers = []
+# optionally also send every sentence once as udp broadcast or multicast
+udp_mode = config.get('udp_mode') # None, 'broadcast' or 'multicast'
+if udp_mode and udp_nmea.start(udp_mode, config.get('udp_port', udp_nmea.udp_port)):
+    responder.advertise("_nmea", "_udp", port=config.get('udp_port', udp_nmea.udp_port))
+
+# each tcp client has its own bounded send queue drained by its own task,
+# so forwarding from ingest is one put per client and a stalled client only
+# delays itself.  Sentences are gathered into one segment per flush period,
+# or sooner when nmea_batch are waiting or one is urgent.
+nmea_queue_size = 64
+nmea_policy = sendqueue.DROP_OLDEST
+nmea_evict_drops = 256 # disconnect a client that drops this many in a row
+nmea_batch = 16
+nmea_flush_period = 100 # ms
+nmea_segment_size = 1024
+nmea_queues = []
+
+# close a client without waiting for unsent data, on cpython close() would
+# wait for it to be sent
+def abort(writer):
+    transport = getattr(writer, 'transport', None)
+    if transport:
+        transport.abort()
+    else:
+        writer.close()
+
+async def nmea_sender(writer, queue):
+    try:
+        while await queue.wait():
+            await queue.linger(nmea_flush_period)
+            lines = queue.take(nmea_segment_size)
+            writer.write(b''.join(lines))
+            await writer.drain()
+            queue.done(len(lines))
+            if latency.tcp_line is not None:
+                latency.sent_tcp(lines)
+    except Exception as e:
+        print('exception writing to nmea client', e, writer)
+    queue.close() # closes the writer, ending the read in handle_request
+
 async def serve_nmea():
     async def handle_request(reader, writer):
-        print('nmea client connected', writer)
-        writers.append(writer)
-        while writer in writers:
-            try:
-                # do not use incomming data, simply discard it                
-                await reader.read(1024)
-            except Exception as e:
-                break
-
-        print('nmea client lost', writer)
-        writers.remove(writer)
-        await writer.aclose()
+        print('nmea client connected', writer.get_extra_info('peername'))
+        queue = sendqueue.SendQueue(nmea_queue_size, nmea_policy,
+                                    nmea_evict_drops, nmea_batch)
+        queue.on_close = lambda: abort(writer) # evicting unblocks the sender
+        nmea_queues.append(queue)
+        asyncio.create_task(nmea_sender(writer, queue))
+        try:
+            while not queue.closed:
+                # do not use incomming data, simply discard it
+                if not await reader.read(1024):
+                    break # client closed the connection
+        except Exception as e:
+            pass
+
+        queue.close()
+        nmea_queues.remove(queue)
+        print('nmea client lost', writer, queue.stats())
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
 
     print('nmea server loading...')
+    if udp_nmea.queue:
+        asyncio.create_task(udp_nmea.sender())
     try:
-        server = await asyncio.start_server(handle_request, host='0.0.0.0', port=nmea_port)
+        server = await asyncio.start_server(handle_request, host='0.0.0.0',
+                                            port=config['nmea_port'])
         await asyncio.sleep(1)
         print('nmea server started')
         await server.wait_closed()
@@ -56,17 +111,22 @@ async def serve_nmea():
         print('server exception', e)
 
     print('nmea server exited')
+    tracklog.flush()
     machine.reset()
 
-async def write_nmea(line):
-    lwriters = list(writers)
-    for writer in lwriters:
-        try:
-            await writer.awrite(line)
-        except Exception as e:
-            print("exception writing to writer", e, writer)
-            writers.remove(writer)
-    print(line.strip())
+# called from ingest, line may be a view of the uart buffer so it is copied
+def write_nmea(line, urgent=False):
+    if nmea_queues or udp_nmea.queue:
+        line = bytes(line)
+        if latency.sampling:
+            latency.tcp_line = line
+        for queue in nmea_queues:
+            queue.put(line, urgent)
+        udp_nmea.write(line, urgent)
+
+# sent, frames and dropped for each connected client
+def nmea_stats():
+    return [queue.stats() for queue in nmea_queues]
 
 async def maintain_connection():
     while True:
@@ -78,7 +138,7 @@ async def maintain_connection():
                 ap.config(ssid='picow', password='encryptme')
                 ap.active(True)
                 while ap.active() == False:
-                    await asyncio.sleep(10
+                    await asyncio.sleep(10)
 
             
             while not wlan.isconnected():
@@ -90,6 +150,7 @@ async def maintain_connection():
 
                 if time.ticks_ms() - t0 > 20*1000:
                     print('reset from timeout')
+                    tracklog.flush()
                     machine.reset()
 
                 await asyncio.sleep(1)
@@ -112,8 +173,8 @@ def main():
         while True:
             line = non_blocking_readline(uart0)
             if line:
-                await write_nmea(line)
-                print("read line", line.strip(), len(line))
+                write_nmea(line)
+                print("read line", bytes(line).strip(), len(line))
             else:
                 await asyncio.sleep(1)    
     
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+#
+#   Copyright (C) 2024 Sean D'Epagnier
+#
+# This Program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+
+# store a gzipped copy beside each static file before copying src to the
+# pico, web.py serves it to browsers that accept gzip.  Run on the host:
+#   python3 tools/compress_static.py [directory]
+import gzip, os, sys
+
+def compress(filename):
+    gzname = filename + '.gz'
+    if os.path.exists(gzname) and os.path.getmtime(gzname) >= os.path.getmtime(filename):
+        return False # up to date
+    with open(filename, 'rb') as f:
+        data = f.read()
+    # mtime 0 keeps the output, and so the etag size, the same between builds
+    with open(gzname, 'wb') as f:
+        f.write(gzip.compress(data, 9, mtime=0))
+    print(filename, len(data), '->', os.path.getsize(gzname))
+    return True
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'static')
+    for name in sorted(os.listdir(path)):
+        filename = os.path.join(path, name)
+        if os.path.isfile(filename) and not name.endswith('.gz'):
+            compress(filename)
+
+if __name__ == '__main__':
+    main()